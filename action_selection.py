@@ -0,0 +1,77 @@
+import numpy as np
+
+# Strategies select_actions understands
+STRATEGIES = ("greedy", "epsilon_greedy", "boltzmann", "top_k")
+
+
+def joint_scores(current_q, next_q, legal=None):
+    """
+    Score of every (current, next) location pair for a batch of states:
+    the outer sum of the two heads, (n, 97, 97), with pairs outside the
+    legal mask set to -inf. legal is one (97, 97) mask for every state or
+    an (n, 97, 97) batch of them, None allows every pair.
+    """
+    scores = current_q[:, :, np.newaxis] + next_q[:, np.newaxis, :]
+    if legal is not None:
+        scores = np.where(legal, scores, -np.inf)
+    return scores.reshape(len(scores), -1)
+
+
+def split(pairs, locations=97):
+    return np.divmod(pairs, locations)
+
+
+def greedy_pairs(scores):
+    return np.argmax(scores, axis=1)
+
+
+def uniform_pairs(scores, rng):
+    # A random allowed pair per row, any pair for rows with none allowed
+    keys = rng.random(scores.shape)
+    keys[np.isneginf(scores) & np.isfinite(scores).any(axis=1, keepdims=True)] = -1
+    return np.argmax(keys, axis=1)
+
+
+def boltzmann_pairs(scores, temperature, rng):
+    # Gumbel-max: argmax of score / temperature plus Gumbel noise samples
+    # the softmax over allowed pairs without normalizing
+    gumbel = -np.log(-np.log(rng.random(scores.shape)))
+    return np.argmax(scores / temperature + gumbel, axis=1)
+
+
+def top_k_pairs(scores, k, rng):
+    # Uniform among the k best allowed pairs of every row
+    k = min(k, scores.shape[1])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    allowed = np.isfinite(np.take_along_axis(scores, best, axis=1))
+    keys = np.where(allowed | ~allowed.any(axis=1, keepdims=True), rng.random(best.shape), -1)
+    return np.take_along_axis(best, np.argmax(keys, axis=1)[:, np.newaxis], axis=1)[:, 0]
+
+
+def select_actions(current_q, next_q, legal=None, strategy="epsilon_greedy", epsilon=0.0,
+                   temperature=1.0, k=5, rng=None):
+    """
+    Picks one (current, next) location pair per state from the joint
+    scores of the two heads, only among legal pairs when a mask is given.
+
+    greedy: the best pair. epsilon_greedy: a uniformly random allowed pair
+    with probability epsilon, else the best. boltzmann: sampled with
+    probability proportional to exp(score / temperature). top_k: uniform
+    among the k best pairs. Returns current and next location arrays.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError("Unknown action selection strategy {0!r}, use one of {1}".format(strategy, STRATEGIES))
+    rng = rng if rng is not None else np.random.default_rng()
+    scores = joint_scores(np.asarray(current_q, dtype=np.float64), np.asarray(next_q, dtype=np.float64), legal)
+
+    if strategy == "boltzmann":
+        pairs = boltzmann_pairs(scores, temperature, rng)
+    elif strategy == "top_k":
+        pairs = top_k_pairs(scores, k, rng)
+    else:
+        pairs = greedy_pairs(scores)
+        if strategy == "epsilon_greedy" and epsilon > 0:
+            explore = rng.random(len(scores)) < epsilon
+            if explore.any():
+                pairs[explore] = uniform_pairs(scores[explore], rng)
+    return split(pairs, current_q.shape[1])
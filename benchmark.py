@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from compact_game import CompactGame
+from deals import benchmark_deals
+from solitaire import Game
+from vec_game import VecGame
+
+# Engines timed by the step, reset and observation benchmarks
+ENGINES = {"Game": Game, "CompactGame": CompactGame}
+
+
+def scripted_trace(deal, length, seed=0):
+    """
+    Fixed action trace for one deal: (length, 2) array of current and next
+    locations, half legal CompactGame moves and half random locations,
+    so every run and every engine replays exactly the same inputs.
+    """
+    rng = random.Random(seed)
+    game = CompactGame()
+    game.deal(deal)
+    trace = np.zeros((length, 2), dtype=np.int16)
+    for index in range(length):
+        legal = np.flatnonzero(game.legal_actions())
+        if len(legal) > 0 and rng.random() < 0.5:
+            trace[index] = divmod(int(legal[rng.randrange(0, len(legal))]), game.action_space)
+        else:
+            trace[index] = (rng.randrange(0, game.action_space), rng.randrange(0, game.action_space))
+        game.step({'current_location': int(trace[index, 0]), 'next_location': int(trace[index, 1])})
+    return trace
+
+
+def summarize(latencies, units=1):
+    # latencies in nanoseconds, units is how many steps one call makes
+    latencies = np.asarray(latencies, dtype=np.float64)
+    total = latencies.sum() / 1e9
+    return {
+        "calls": len(latencies),
+        "per_second": units * len(latencies) / total if total > 0 else float("inf"),
+        "mean_us": latencies.mean() / 1e3,
+        "p50_us": np.percentile(latencies, 50) / 1e3,
+        "p90_us": np.percentile(latencies, 90) / 1e3,
+        "p99_us": np.percentile(latencies, 99) / 1e3,
+        "max_us": latencies.max() / 1e3,
+    }
+
+
+def measure(call, inputs, units=1, allocations=True, prepare=None):
+    """
+    Runs call(*arguments) for every tuple in inputs, timed one call at a
+    time, then again under tracemalloc for the memory figures:
+    peak_bytes_per_call is the mean peak of memory allocated during a call
+    and retained_blocks_per_call the blocks still held after the run.
+    prepare(*arguments), if given, runs before every call outside the
+    timing and the peaks.
+    """
+    inputs = list(inputs)
+    timer = time.perf_counter_ns
+    latencies = []
+    for arguments in inputs:
+        if prepare is not None:
+            prepare(*arguments)
+        start = timer()
+        call(*arguments)
+        latencies.append(timer() - start)
+    result = summarize(latencies, units)
+
+    if allocations:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        peaks = 0
+        for arguments in inputs:
+            if prepare is not None:
+                prepare(*arguments)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            call(*arguments)
+            peaks += tracemalloc.get_traced_memory()[1] - current
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+        result["peak_bytes_per_call"] = peaks / len(inputs)
+        result["retained_blocks_per_call"] = retained / len(inputs)
+    return result
+
+
+def report(name, result):
+    print("{0:<32} {1:>12.0f}/s  p50 {2:>8.1f}us  p99 {3:>8.1f}us".format(
+        name, result["per_second"], result["p50_us"], result["p99_us"]))
+    return result
+
+
+def bench_engines(deals, traces, results):
+    for engine_name, engine in ENGINES.items():
+        game = engine()
+        results[engine_name + ".reset"] = report(engine_name + ".reset", measure(game.deal, [(deal,) for deal in deals]))
+
+        # Every step call is timed on its own, the deal before the first
+        # step of a trace is made untimed by prepare
+        def deal_first(deal, action):
+            if deal is not None:
+                game.deal(deal)
+
+        steps = [(deal if index == 0 else None, {'current_location': int(current), 'next_location': int(next_loc)})
+                 for deal, trace in zip(deals, traces) for index, (current, next_loc) in enumerate(trace)]
+        results[engine_name + ".step"] = report(
+            engine_name + ".step", measure(lambda deal, action: game.step(action), steps, prepare=deal_first))
+
+        # Full rebuilds of every pile, as after a deal
+        def rebuild_legal():
+            game.changed_piles = set(range(len(game.target_locations)))
+            game.legal_actions()
+
+        game.deal(deals[0])
+        results[engine_name + ".update_observation"] = report(
+            engine_name + ".update_observation", measure(game.update_observation, [()] * len(deals)))
+        results[engine_name + ".legal_actions"] = report(
+            engine_name + ".legal_actions", measure(rebuild_legal, [()] * len(deals)))
+
+
+def bench_vec_game(num_games, steps, seed, results):
+    env = VecGame(num_games, max_steps=300, seed=seed)
+    env.reset()
+    rng = np.random.default_rng(seed)
+    actions = [{'current_location': rng.integers(0, 97, num_games), 'next_location': rng.integers(0, 97, num_games)}
+               for _ in range(steps)]
+    results["VecGame.step"] = report("VecGame.step x{0}".format(num_games),
+                                     measure(env.step, [(action,) for action in actions], units=num_games))
+
+
+def bench_agent(deals, steps, results):
+    try:
+        from agents import DeepQNetwork
+    except ImportError as error:
+        print("Skipping agent benchmarks:", error)
+        return
+    # The agent writes temp_images, metrics.csv, profile.jsonl and model_dir
+    # to the working directory, so it runs in a throwaway one
+    directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            time_agent(DeepQNetwork, deals, steps, results)
+        finally:
+            os.chdir(directory)
+
+
+def time_agent(agent_class, deals, steps, results):
+    env = CompactGame()
+    agent = agent_class(env)
+    agent.exploration_rate = 0.0
+    states = []
+    for deal in deals:
+        env.deal(deal)
+        states.append(env.observation.copy())
+    results["DeepQNetwork.convert_state"] = report(
+        "DeepQNetwork.convert_state", measure(agent.convert_state, [(state,) for state in states]))
+    results["DeepQNetwork.act"] = report(
+        "DeepQNetwork.act", measure(agent.act, [(state,) for state in states], allocations=False))
+
+    state = states[0]
+    for _ in range(agent.batch_size):
+        action = agent.act(state)
+        next_state, reward, done, _ = env.step(action)
+        agent.remember(state, next_state, action, reward, done)
+        state = next_state
+    results["DeepQNetwork.memory_replay"] = report(
+        "DeepQNetwork.memory_replay", measure(agent.memory_replay, [()] * steps, allocations=False))
+    agent.close()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    print("\nChange against", baseline_path)
+    for name, result in results.items():
+        if name in baseline:
+            print("{0:<32} {1:>+8.1%}".format(name, result["per_second"] / baseline[name]["per_second"] - 1))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Time the solitaire engines and agents on the benchmark deals")
+    parser.add_argument("--deals", type=int, default=200, help="number of benchmark deals to use")
+    parser.add_argument("--trace-length", type=int, default=200, help="scripted actions per deal")
+    parser.add_argument("--vec-games", type=int, default=256)
+    parser.add_argument("--agent", action="store_true", help="also time DeepQNetwork (needs TensorFlow)")
+    parser.add_argument("--output", default="benchmark.json", help="where the JSON results are written")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    options = parser.parse_args(arguments)
+
+    deals = [bytes(deal) for deal in benchmark_deals()[:options.deals]]
+    traces = [scripted_trace(deal, options.trace_length, seed) for seed, deal in enumerate(deals)]
+
+    results = {}
+    bench_engines(deals, traces, results)
+    bench_vec_game(options.vec_games, options.trace_length, 0, results)
+    if options.agent:
+        bench_agent(deals[:100], 50, results)
+
+    output = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "settings": vars(options),
+        "results": results,
+    }
+    with open(options.output, "w") as output_file:
+        json.dump(output, output_file, indent=2)
+    if options.compare:
+        compare(results, options.compare)
+    return output
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
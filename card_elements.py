@@ -1,5 +1,28 @@
 import random
-import tensorflow as tf
+import numpy as np
+
+# Integer card ids used by the compact engine. A card id is
+# suit * 13 + (value - 1), with suits in the same order as Game.suits
+# (spade, heart, club, diamond), so ids run from 0 to 51.
+CARD_COUNT = 52
+CARD_VALUE = tuple(card % 13 + 1 for card in range(CARD_COUNT))
+CARD_SUIT = tuple(card // 13 for card in range(CARD_COUNT))
+# Suit.value and Suit.get_color_number() of each card, as used in observations
+CARD_SUIT_VALUE = tuple(suit + 1 for suit in CARD_SUIT)
+CARD_COLOR = tuple(2 if suit % 2 == 0 else 1 for suit in CARD_SUIT)
+
+# Rule tables indexed by card id. CAN_STACK[card, onto] when card may be
+# placed on a face up onto in a play pile (alternate colors, one lower),
+# FOUNDATION_NEXT[card, top] when card may go on a foundation topped by top
+# (same suit, one higher). Kings go on empty piles and aces on empty
+# foundations.
+_VALUES = np.array(CARD_VALUE)
+_SUITS = np.array(CARD_SUIT)
+_COLORS = np.array(CARD_COLOR)
+CAN_STACK = (_COLORS[:, np.newaxis] != _COLORS[np.newaxis, :]) & (_VALUES[np.newaxis, :] == _VALUES[:, np.newaxis] + 1)
+FOUNDATION_NEXT = (_SUITS[:, np.newaxis] == _SUITS[np.newaxis, :]) & (_VALUES[:, np.newaxis] == _VALUES[np.newaxis, :] + 1)
+IS_KING = _VALUES == 13
+IS_ACE = _VALUES == 1
 
 class Suit:
     def __init__(self, suit_code=None, color=0, suit_name=0, value=0):
@@ -24,13 +47,25 @@ class Card:
         self.value = value
         self.flipped = False
         self.empty = empty
+        # Index into the rule tables, -1 for the empty placeholder
+        self.id = -1 if empty else self.get_id()
         
     def flip(self):
         self.flipped = not self.flipped
         
+    def get_id(self):
+        # Integer card id, see CARD_COUNT
+        return (self.suit.value - 1) * 13 + int(self.value) - 1
+        
+    def get_observation(self):
+        return int(self.value), self.suit.value, self.suit.get_color_number()
+        
     def __str__(self):        
         return "{0} {1}".format(self.value,self.suit.suit_code)
     
+# Shared placeholder for observation slots without a card
+EMPTY_CARD = Card()
+    
 class Pile:
     def __init__(self):
         self.cards = []
@@ -62,7 +97,9 @@ class Pile:
             
     def draw_top_card(self):
         if len(self.cards) > 0:
-            return self.cards.pop(0).flip()
+            card = self.cards.pop(0)
+            card.flip()
+            return card
         else:
             return None
             
@@ -0,0 +1,386 @@
+import copy
+import numpy as np
+
+from card_elements import CARD_COUNT, CARD_VALUE, CARD_SUIT, CARD_SUIT_VALUE, CARD_COLOR, \
+    CAN_STACK, FOUNDATION_NEXT, IS_KING, IS_ACE
+from deals import encode_deal
+from events import NullEventSink
+from solitaire import Game
+
+# Board layout: a single bytearray holding the 13 piles of Game.state in the
+# same order (7 play piles, deck, discard, 4 foundations). Each pile owns
+# PILE_STRIDE bytes: the card count followed by the cards, bottom card first,
+# so the top card is the last used byte and pushing/popping is O(1).
+PILE_COUNT = 13
+PILE_CAPACITY = 24
+PILE_STRIDE = PILE_CAPACITY + 1
+DECK = 7
+DISCARD = 8
+FOUNDATIONS = (9, 10, 11, 12)
+
+# A stored card is its id with FACE_UP set once it has been turned over
+FACE_UP = 0x40
+CARD_MASK = 0x3F
+
+# Observation columns: index 0 is the empty slot, index id + 1 is a card,
+# rows are value, suit and color as produced by DeepQNetwork.convert_state
+OBSERVATION_TABLE = np.zeros((3, CARD_COUNT + 1), dtype=np.int8)
+OBSERVATION_TABLE[0, 1:] = CARD_VALUE
+OBSERVATION_TABLE[1, 1:] = CARD_SUIT_VALUE
+OBSERVATION_TABLE[2, 1:] = CARD_COLOR
+
+# Random 64 bit key for every (pile, position, stored card byte), positions
+# are XORed together into a Zobrist hash of the table
+ZOBRIST_KEYS = np.random.default_rng(0x5EED).integers(
+    0, 2 ** 63, size=(PILE_COUNT, PILE_CAPACITY, (FACE_UP | CARD_MASK) + 1), dtype=np.uint64)
+ZOBRIST_PILES = np.arange(PILE_COUNT)[:, np.newaxis]
+ZOBRIST_DEPTHS = np.arange(PILE_CAPACITY)
+# Key for every number of redeals left under a pass limit (Rules.passes)
+ZOBRIST_REDEALS = np.random.default_rng(0x5EED + 1).integers(0, 2 ** 63, size=256, dtype=np.uint64)
+
+
+class CompactGame(Game):
+
+    """
+    Description:
+        Drop-in replacement for Game that keeps the whole table in a fixed
+        size bytearray instead of Pile and Card objects.
+
+        Actions, rewards, the pile numbering and the numeric (3, 97)
+        observation are the same as Game: value, suit and color of the
+        card in every slot, 0 when empty.
+
+        Location semantics:
+            A play pile location (0 - 90) picks the card that many slots
+            below the top of the pile, so that card and every card above
+            it are moved. Deck, discard and foundation locations (91 - 96)
+            always move the top card, apart from discard to deck which
+            turns the whole discard pile back over and deck to discard
+            which draws rules.draw cards.
+    """
+
+    def __init__(self, events=None, seed=None, rules=None):
+        super().__init__(events, seed, rules)
+        self.board = bytearray(PILE_COUNT * PILE_STRIDE)
+        # Card id + 1 shown in every slot, 0 when empty
+        self.slots = bytearray(97)
+        # Undo stack, one entry per step since the deal
+        self.history = []
+        self.uncovered = False
+
+    def deal(self, order):
+        # order is the 52 byte deal from deals.py with order[0] on top of
+        # the shuffled deck, dealt the same way as Game.deal
+        order = encode_deal(order)
+        self.deal_order = order
+        self.count = 0
+        self.score = self.rules.start_score
+        self.redeals_left = self.rules.redeals
+        board = self.board
+        board[:] = bytes(len(board))
+        dealt = 0
+        for pile in range(7):
+            base = pile * PILE_STRIDE
+            board[base] = pile + 1
+            for card in range(pile + 1):
+                board[base + 1 + card] = order[dealt]
+                dealt += 1
+            board[base + pile + 1] |= FACE_UP
+        base = DECK * PILE_STRIDE
+        remaining = order[dealt:]
+        board[base] = len(remaining)
+        board[base + 1:base + 1 + len(remaining)] = bytes(reversed(remaining))
+        self.changed_piles = set(range(PILE_COUNT))
+        self.history = []
+        self.update_observation()
+        self.events.record("reset", 0, 0)
+
+    def update_observation(self, piles=None):
+        # Only the slots of the given piles are rewritten, all by default
+        if piles is None:
+            piles = range(PILE_COUNT)
+        board = self.board
+        slots = self.slots
+        for pile in piles:
+            base = pile * PILE_STRIDE
+            if pile < 7:
+                top = base + board[base]
+                start = pile * 13
+                # Face up cards always form an unbroken run from the top
+                for slot in range(13):
+                    position = top - slot
+                    if position > base and board[position] & FACE_UP:
+                        slots[start + slot] = (board[position] & CARD_MASK) + 1
+                    else:
+                        slots[start + slot:start + 13] = bytes(13 - slot)
+                        break
+            else:
+                size = board[base]
+                slots[84 + pile] = (board[base + size] & CARD_MASK) + 1 if size else 0
+        np.take(OBSERVATION_TABLE, np.frombuffer(slots, dtype=np.uint8), axis=1,
+                out=self.observation)
+
+    def step(self, action):
+        count = self.count
+        score = self.score
+        if self.check_if_completed():
+            self.history.append((count, None, 0, 0, 0, False, score))
+            self.events.record("win", 0, 0)
+            reward = 1
+            done = True
+            return self.observation.copy(), reward, done, {"truncated": False}
+        else:
+            done = False
+
+        action = self.translate_action(action)
+
+        move = self.assign_action(action)
+
+        if not self.valid_action(action, move):
+            self.history.append((count, None, 0, 0, 0, False, score))
+            return self.observation.copy(), -1, done, {"truncated": self.count >= self.rules.step_limit}
+
+        reward = self.move_cards(action, move)
+        rules = self.rules
+        self.score = max(rules.score_floor, score + rules.scores[move] + rules.flip_scores[self.uncovered])
+        self.history.append((count, move, action['current_location'], action['next_location'], action['number'], self.uncovered, score))
+        self.changed_piles.update((action['current_location'], action['next_location']))
+
+        self.update_observation((action['current_location'], action['next_location']))
+
+        return self.observation.copy(), reward, done, {"truncated": self.count >= rules.step_limit}
+
+    def cards_to_move(self, current, location):
+        if location < 91:
+            return location % 13 + 1
+        return 1
+
+    def pile_size(self, pile):
+        return self.board[pile * PILE_STRIDE]
+
+    def get_playable_count(self, location):
+        board = self.board
+        base = location * PILE_STRIDE
+        position = base + board[base]
+        while position > base and board[position] & FACE_UP:
+            position -= 1
+        return base + board[base] - position
+
+    def get_game_elements(self):
+        return_object = {
+            "deck": self.pile_to_string(DECK),
+            "discard": self.pile_to_string(DISCARD),
+            "play_piles": [self.pile_to_string(pile) for pile in range(0, 7)],
+            "foundations": [self.pile_to_string(pile) for pile in FOUNDATIONS]
+        }
+        return return_object
+
+    def print_in_order(self):
+        for pile in range(0, PILE_COUNT):
+            print(self.pile_to_string(pile))
+
+    def pile_to_string(self, pile):
+        # Same format as Pile.__str__
+        base = pile * PILE_STRIDE
+        cards = self.board[base + 1:base + 1 + self.board[base]]
+        returned_cards = ["{0} {1}".format(CARD_VALUE[card & CARD_MASK], self.suits[CARD_SUIT[card & CARD_MASK]].suit_code)
+                          for card in cards if card & FACE_UP]
+        flipped_down_count = len(cards) - len(returned_cards)
+        if flipped_down_count > 0:
+            returned_cards.insert(0, "{0} card(s)".format(flipped_down_count))
+        return ", ".join(returned_cards)
+
+    def valid_action(self, action, move):
+
+        # Cannot do move that is not found in reward
+        if move not in self.reward:
+            return False
+
+        return self.can_move(action['current_location'], action['next_location'], action['number'], move)
+
+    def can_move(self, current, next_loc, number, move):
+        board = self.board
+        base = current * PILE_STRIDE
+        size = board[base]
+
+        # Cannot move cards that don't exist
+        if size == 0 or number > size:
+            return False
+
+        # Deck and discard rules
+        if move == "deck_discard":
+            return True
+        if move == "discard_deck":
+            return board[DECK * PILE_STRIDE] == 0 and self.redeals_left > 0
+
+        # Cannot move face down cards
+        bottom_card = board[base + size - number + 1]
+        if not bottom_card & FACE_UP:
+            return False
+        bottom_card &= CARD_MASK
+
+        next_base = next_loc * PILE_STRIDE
+        next_size = board[next_base]
+
+        # Foundation moves: a single card, aces first, then same suit in order
+        if next_loc in FOUNDATIONS:
+            if number != 1:
+                return False
+            if next_size == 0:
+                return IS_ACE[bottom_card]
+            return FOUNDATION_NEXT[bottom_card, board[next_base + next_size] & CARD_MASK]
+
+        # Cannot stack onto blank spaces unless kings
+        if next_size == 0:
+            return IS_KING[bottom_card]
+
+        # Cannot stack onto face down cards
+        top_card = board[next_base + next_size]
+        if not top_card & FACE_UP:
+            return False
+
+        # Alternate colors in descending order
+        return CAN_STACK[bottom_card, top_card & CARD_MASK]
+
+    def move_cards(self, action, move):
+        board = self.board
+        current = action['current_location']
+        base = current * PILE_STRIDE
+        size = board[base]
+        next_base = action['next_location'] * PILE_STRIDE
+        next_size = board[next_base]
+
+        self.uncovered = False
+        if move == "discard_deck":
+            # Turn the discard pile over so its bottom card is on top
+            for index in range(size):
+                board[next_base + 1 + index] = board[base + size - index] & CARD_MASK
+            board[next_base] = size
+            board[base + 1:base + 1 + size] = bytes(size)
+            board[base] = 0
+            self.redeals_left -= 1
+            self.events.record(move, current, action['next_location'])
+
+        elif move == "deck_discard":
+            # rules.draw cards one by one, the last drawn ends on top
+            number = min(self.rules.draw, size)
+            for index in range(number):
+                board[next_base + next_size + 1 + index] = board[base + size - index] | FACE_UP
+                self.events.record(move, current, action['next_location'], board[base + size - index] & CARD_MASK)
+            board[next_base] = next_size + number
+            board[base + size - number + 1:base + size + 1] = bytes(number)
+            board[base] = size - number
+            action['number'] = number
+
+        else:
+            number = action['number']
+            start = base + size - number + 1
+            board[next_base + next_size + 1:next_base + next_size + 1 + number] = board[start:start + number]
+            board[next_base] = next_size + number
+            board[base] = size - number
+            self.events.record(move, current, action['next_location'], board[start] & CARD_MASK)
+            # Flip the card left on top of a play pile
+            self.uncovered = current < 7 and size > number and not board[start - 1] & FACE_UP
+            if self.uncovered:
+                board[start - 1] |= FACE_UP
+                self.events.record("flip", current, current, board[start - 1] & CARD_MASK)
+            board[start:start + number] = bytes(number)
+            return self.reward[move]
+
+        return self.reward[move]
+
+    def undo(self):
+        # Reverts the last step, returns the observation from before it.
+        # Vacated bytes are zeroed here and in move_cards, so the board
+        # bytes of a position are the same however it was reached.
+        count, move, current, next_loc, number, uncovered, self.score = self.history.pop()
+        self.count = count
+        if move is None:
+            return self.observation.copy()
+
+        board = self.board
+        base = current * PILE_STRIDE
+        size = board[base]
+        next_base = next_loc * PILE_STRIDE
+        next_size = board[next_base]
+
+        if move == "discard_deck":
+            for index in range(next_size):
+                board[base + 1 + index] = board[next_base + next_size - index] | FACE_UP
+            board[base] = next_size
+            board[next_base + 1:next_base + 1 + next_size] = bytes(next_size)
+            board[next_base] = 0
+            self.redeals_left += 1
+
+        elif move == "deck_discard":
+            for index in range(number):
+                board[base + size + 1 + index] = board[next_base + next_size - index] & CARD_MASK
+            board[base] = size + number
+            board[next_base + next_size - number + 1:next_base + next_size + 1] = bytes(number)
+            board[next_base] = next_size - number
+
+        else:
+            if uncovered:
+                board[base + size] &= CARD_MASK
+            start = next_base + next_size - number + 1
+            board[base + size + 1:base + size + 1 + number] = board[start:start + number]
+            board[start:start + number] = bytes(number)
+            board[base] = size + number
+            board[next_base] = next_size - number
+
+        self.changed_piles.update((current, next_loc))
+        self.update_observation((current, next_loc))
+        return self.observation.copy()
+
+    def snapshot(self):
+        # The whole game is the board bytes, the step count, the score and
+        # the passes left
+        return bytes(self.board), self.count, self.score, self.redeals_left
+
+    def restore(self, snapshot):
+        board, self.count, self.score, redeals_left = snapshot
+        # Only piles that differ need their observation and legal moves
+        # redone, and the deck and discard when the redeals left differ,
+        # as turning the discard pile over depends on them
+        changed = [pile for pile in range(PILE_COUNT)
+                   if self.board[pile * PILE_STRIDE:(pile + 1) * PILE_STRIDE] != board[pile * PILE_STRIDE:(pile + 1) * PILE_STRIDE]]
+        if redeals_left != self.redeals_left:
+            changed = sorted(set(changed) | {DECK, DISCARD})
+        self.redeals_left = redeals_left
+        self.board[:] = board
+        self.history = []
+        self.changed_piles.update(changed)
+        self.update_observation(changed)
+
+    def clone(self):
+        # Independent copy that reports no events and has no undo history
+        game = copy.copy(self)
+        game.events = NullEventSink()
+        game.rng = copy.deepcopy(self.rng)
+        game.board = bytearray(self.board)
+        game.slots = bytearray(self.slots)
+        game.observation = self.observation.copy()
+        game.legal_mask = self.legal_mask.copy()
+        game.changed_piles = set(self.changed_piles)
+        game.history = []
+        return game
+
+    def zobrist_hash(self):
+        # Same value for the same table however it was reached, the step
+        # count is not part of the position. Under a pass limit the
+        # redeals left are, without one they never matter.
+        piles = np.frombuffer(self.board, dtype=np.uint8).reshape(PILE_COUNT, PILE_STRIDE)
+        live = ZOBRIST_DEPTHS < piles[:, :1]
+        keys = ZOBRIST_KEYS[ZOBRIST_PILES, ZOBRIST_DEPTHS, piles[:, 1:]]
+        position = int(np.bitwise_xor.reduce(keys[live]))
+        if self.rules.passes is not None:
+            position ^= int(ZOBRIST_REDEALS[self.redeals_left % len(ZOBRIST_REDEALS)])
+        return position
+
+    def check_if_completed(self):
+        self.count += 1
+        board = self.board
+        for pile in range(0, 9):
+            if board[pile * PILE_STRIDE] != 0:
+                return False
+        return True
@@ -0,0 +1,165 @@
+import os
+import random
+import numpy as np
+
+from card_elements import CARD_COUNT, CARD_VALUE
+from compact_game import CompactGame, DECK, DISCARD, FACE_UP, CARD_MASK, PILE_STRIDE
+from solver import SOLVABLE, UNSOLVABLE, UNKNOWN, classify_deals
+
+RESULTS = (SOLVABLE, UNSOLVABLE, UNKNOWN)
+
+# One row per deal of a feature table
+FEATURE_DTYPE = np.dtype([
+    ("deal", "u1", (CARD_COUNT,)),
+    ("result", "u1"),             # index in RESULTS
+    ("solution_length", "i2"),    # actions in the shortened solver line, -1 if none
+    ("deck_cycles", "u1"),        # discard to deck moves in that line
+    ("blocked_aces", "u1"),       # face down cards lying on top of aces
+    ("difficulty", "f4"),
+])
+
+# Difficulty of deals the solver did not solve, above any solved deal
+UNSOLVED_DIFFICULTY = 1e6
+
+
+def blocked_aces(deal):
+    game = CompactGame()
+    game.deal(deal)
+    board = game.board
+    blocked = 0
+    for pile in range(7):
+        base = pile * PILE_STRIDE
+        size = board[base]
+        for depth in range(size):
+            if CARD_VALUE[board[base + 1 + depth] & CARD_MASK] == 1:
+                blocked += sum(1 for card in board[base + 2 + depth:base + 1 + size] if not card & FACE_UP)
+    return blocked
+
+
+def shorten_line(deal, line):
+    # The line without its detours: whenever play comes back to a position
+    # it was in before, the moves in between are dropped. Cycling the stock
+    # round to where it was is the usual one.
+    game = CompactGame()
+    game.deal(deal)
+    shortened = []
+    positions = [(bytes(game.board), game.redeals_left)]
+    seen = {positions[0]: 0}
+    for action in line:
+        current, next_loc = divmod(action, game.action_space)
+        game.step({'current_location': current, 'next_location': next_loc})
+        position = (bytes(game.board), game.redeals_left)
+        if position in seen:
+            keep = seen[position]
+            for dropped in positions[keep + 1:]:
+                del seen[dropped]
+            del positions[keep + 1:]
+            del shortened[keep:]
+            continue
+        shortened.append(action)
+        seen[position] = len(positions)
+        positions.append(position)
+    return shortened
+
+
+def deal_features(deal, result, line):
+    game = CompactGame()
+    if line is not None:
+        line = shorten_line(deal, line)
+    redeal = game.target_locations[DISCARD] * game.action_space + game.target_locations[DECK]
+    solution_length = len(line) if line is not None else -1
+    deck_cycles = sum(1 for action in line if action == redeal) if line is not None else 0
+    aces = blocked_aces(deal)
+    if result == SOLVABLE:
+        difficulty = solution_length + 20 * deck_cycles + 10 * aces
+    else:
+        difficulty = UNSOLVED_DIFFICULTY + aces
+    return (np.frombuffer(bytes(deal), dtype=np.uint8), RESULTS.index(result), solution_length,
+            min(deck_cycles, 255), aces, difficulty)
+
+
+def build_table(directory, deals, node_limit=100000, time_limit=10, workers=None, levels=10):
+    """
+    Solves every deal and writes the feature table to directory:
+    features.npy, one FEATURE_DTYPE row per deal, and index.npy, the rows
+    of solved deals sorted by difficulty, cut into levels equal parts.
+    """
+    os.makedirs(directory, exist_ok=True)
+    deals = [bytes(deal) for deal in deals]
+    solved = classify_deals(deals, node_limit, time_limit, workers)
+    features = np.array([deal_features(deal, result, line) for deal, (result, line, _) in zip(deals, solved)],
+                        dtype=FEATURE_DTYPE)
+    np.save(os.path.join(directory, "features.npy"), features)
+    write_index(directory, features, levels)
+    return features
+
+
+def write_index(directory, features, levels):
+    # Row numbers of the solved deals from easiest to hardest, then one
+    # start offset per level and the end
+    rows = np.flatnonzero(features["result"] == RESULTS.index(SOLVABLE))
+    rows = rows[np.argsort(features["difficulty"][rows], kind="stable")].astype(np.int64)
+    offsets = np.linspace(0, len(rows), levels + 1).round().astype(np.int64)
+    np.save(os.path.join(directory, "index.npy"), np.concatenate([[levels], offsets, rows]))
+
+
+def linear_schedule(levels, episodes):
+    # Level for an episode, from the easiest to the hardest over episodes
+    return lambda episode: min(levels - 1, episode * levels // max(episodes, 1))
+
+
+def fixed_schedule(level):
+    return lambda episode: level
+
+
+class CurriculumDeals(object):
+    """
+    Serves deals from a table written by build_table, picking the level of
+    every episode with schedule(episode) and a random deal of that level.
+    Both files are memory mapped and a lookup is two array reads, so it
+    adds nothing to reset. Set it as Game.deals and Game.reset plays its
+    deals:
+
+        env.deals = CurriculumDeals("./curriculum", linear_schedule(10, 20000))
+
+    Only solved deals are served; levels without deals fall back to the
+    nearest easier one. Game.reset(seed=...) reseeds the deal choice and
+    restarts the schedule from episode 0, so the same seed gives the same
+    deals whatever was played before.
+    """
+
+    def __init__(self, directory, schedule=None, seed=None):
+        self.features = np.load(os.path.join(directory, "features.npy"), mmap_mode="r")
+        index = np.load(os.path.join(directory, "index.npy"), mmap_mode="r")
+        self.levels = int(index[0])
+        self.offsets = index[1:self.levels + 2]
+        self.rows = index[self.levels + 2:]
+        if len(self.rows) == 0:
+            raise ValueError("No solved deals in {0}".format(directory))
+        self.schedule = schedule or fixed_schedule(0)
+        self.rng = random.Random(seed)
+        self.episode = 0
+        self.last_row = None
+
+    def seed(self, seed):
+        # Game.reset(seed=...) calls this, so a seed gives the same deals
+        self.rng.seed(seed)
+        self.episode = 0
+
+    def next_deal(self):
+        level = max(0, min(self.levels - 1, self.schedule(self.episode)))
+        self.episode += 1
+        start, stop = int(self.offsets[level]), int(self.offsets[level + 1])
+        while start == stop and level > 0:
+            level -= 1
+            start, stop = int(self.offsets[level]), int(self.offsets[level + 1])
+        if start == stop:
+            start, stop = 0, len(self.rows)
+        self.last_row = int(self.rows[self.rng.randrange(start, stop)])
+        return bytes(self.features["deal"][self.last_row])
+
+
+if __name__ == "__main__":
+    from deals import benchmark_deals
+
+    print(len(build_table("./curriculum", benchmark_deals())), "deals indexed")
@@ -0,0 +1,58 @@
+import os
+import random
+import numpy as np
+
+from card_elements import CARD_COUNT
+
+# Fixed deals shipped with the repo for benchmarks and evaluation
+BENCHMARK_DEALS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_deals.bin")
+BENCHMARK_SEED = 20240101
+BENCHMARK_SIZE = 1000
+
+# A deal is the shuffled deck as 52 bytes of card ids, the first byte is
+# the top card, as taken by Game.deal. A deal file is deals back to back.
+
+
+def shuffled_deal(rng):
+    order = list(range(CARD_COUNT))
+    rng.shuffle(order)
+    return bytes(order)
+
+
+def encode_deal(order):
+    deal = bytes(order)
+    if sorted(deal) != list(range(CARD_COUNT)):
+        raise ValueError("A deal must be a permutation of the {0} card ids".format(CARD_COUNT))
+    return deal
+
+
+def decode_deal(deal):
+    return list(encode_deal(deal))
+
+
+def save_deals(path, deals):
+    with open(path, "wb") as deal_file:
+        for deal in deals:
+            deal_file.write(encode_deal(deal))
+
+
+def load_deals(path):
+    # (n, 52) uint8 array, one deal per row, mapped rather than read
+    deals = np.memmap(path, dtype=np.uint8, mode="r")
+    if len(deals) % CARD_COUNT != 0:
+        raise ValueError("{0} is not a whole number of {1} byte deals".format(path, CARD_COUNT))
+    return deals.reshape(-1, CARD_COUNT)
+
+
+def make_corpus(count, seed):
+    rng = random.Random(seed)
+    return [shuffled_deal(rng) for _ in range(count)]
+
+
+def benchmark_deals():
+    return load_deals(BENCHMARK_DEALS)
+
+
+if __name__ == "__main__":
+    # Rebuilds benchmark_deals.bin, only needed if the corpus is lost
+    save_deals(BENCHMARK_DEALS, make_corpus(BENCHMARK_SIZE, BENCHMARK_SEED))
@@ -0,0 +1,327 @@
+import os, shutil
+from collections import deque
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Dense, Input
+from tensorflow.keras import layers
+from tensorflow.keras.optimizers import Adam
+
+from agents import RandomAgent
+from action_selection import select_actions
+from numpy_policy import NumpyPolicy
+from replay import PrioritizedReplayBuffer, LEGAL_COLUMNS, pack_legal, unpack_legal_columns
+from profiling import Profiler
+from monitoring import BackgroundWorker, MetricLog, CheckpointManager, plot_metrics
+
+class DeepQNetwork(RandomAgent):
+    def __init__(self, environment, legal_moves=False, memory=None):
+        self.environment = environment
+        self.legal_moves = legal_moves
+        self.action_space = environment.action_space
+        
+        # Learning rates
+        self.learning_rate = 0.001
+        self.discount = 1
+        
+        # Exploration
+        self.min_exploration_rate = 0.01
+        self.exploration_rate = 1.0
+        self.exploration_decay = 0.8/10000
+        # How actions are picked from the joint (current, next) scores, one
+        # of action_selection.STRATEGIES; boltzmann and top_k ignore the
+        # exploration rate
+        self.action_selection = "epsilon_greedy"
+        self.temperature = 1.0
+        self.top_k = 5
+        self.rng = np.random.default_rng()
+
+        # Stabilization, read when build_training traces the update
+        self.double_dqn = True
+        self.target_update_interval = 100
+        self.replays = 0
+        
+        # Build Network
+        self.model = self.build_model()
+        self.build_inference()
+        self.build_training()
+        self.batch_size=128
+        
+        # Memory Replay, any buffer from replay.py
+        # e.g. MemmapReplayBuffer("./replay_dir") to keep experience on disk
+        self.memories = memory if memory is not None else PrioritizedReplayBuffer(5000)
+        
+        # Plotting variables
+        self.file_names = []
+        self.total_reward = 0
+        self.invalid_count = 0
+        self.plotting_iterations = 250
+        self.games_won = deque(maxlen=self.plotting_iterations)
+        # Rolling metrics, also streamed to metrics.csv
+        self.metrics = MetricLog("metrics.csv")
+        # Phase timers and counters, reported every plotting_iterations
+        self.profiler = Profiler()
+        self.image_path = "./temp_images"
+        self.model_directory = "./model_dir"
+        if os.path.exists(self.image_path):
+            shutil.rmtree(self.image_path)
+        os.mkdir(self.image_path)
+        # Plots and checkpoints are written by a background thread
+        self.checkpoints = CheckpointManager(self.model_directory, keep=5)
+        self.background = BackgroundWorker()
+
+        
+    def build_model(self):
+        value_inputs = Input(shape=(97), name="value")
+        suit_inputs = Input(shape=(97), name="suit")
+        color_inputs = Input(shape=(97), name="color")
+        
+        inputs = layers.concatenate([value_inputs, suit_inputs, color_inputs])
+        
+        # Head
+        head = Dense(256,activation = 'tanh')(inputs)
+        head = Dense(64,activation = 'tanh')(head)
+        # head = Dense(64,activation = 'tanh')(head)
+        # Tail
+        cur = Dense(97, activation='linear')(head)
+        nex = Dense(97, activation='linear')(head)
+        
+        model = tf.keras.models.Model(inputs=[value_inputs, suit_inputs, color_inputs], outputs=[cur, nex])
+        optimizer = Adam(self.learning_rate)
+        model.compile(optimizer, loss="mse")
+        model.summary()
+        # keras.utils.plot_model(model, "solitaire_model.png", show_shapes=True)
+        print('\nAgent Initialized\n')
+        return model
+        
+    def build_inference(self):
+        # Traced forward passes with fixed input signatures, one for a
+        # single observation (act) and one for any batch size (act_batch,
+        # memory_replay). Much cheaper per call than model.predict.
+        def forward(states):
+            states = tf.cast(states, tf.float32)
+            return self.model({"value": states[:, 0], "suit": states[:, 1], "color": states[:, 2]}, training=False)
+        self.predict_single = tf.function(forward, input_signature=[tf.TensorSpec((1, 3, 97), tf.int8)])
+        self.predict_batch = tf.function(forward, input_signature=[tf.TensorSpec((None, 3, 97), tf.int8)])
+
+    def build_training(self):
+        # The target network is a copy of the model refreshed every
+        # target_update_interval replays, it supplies the next state values
+        self.target_model = tf.keras.models.clone_model(self.model)
+        self.target_model.set_weights(self.model.get_weights())
+        optimizer = self.model.optimizer
+        discount = float(self.discount)
+        double_dqn = self.double_dqn
+
+        def model_inputs(states):
+            states = tf.cast(states, tf.float32)
+            return {"value": states[:, 0], "suit": states[:, 1], "color": states[:, 2]}
+
+        def best_pairs(current_q, next_q, next_legal, next_columns):
+            # The (current, next) pair act would pick: best joint score of
+            # both heads among the legal pairs, all pairs when none is legal.
+            # next_legal only covers the next locations in next_columns.
+            scores = current_q[:, :, tf.newaxis] + tf.gather(next_q, next_columns, axis=1)[:, tf.newaxis, :]
+            next_legal = tf.logical_or(next_legal, tf.logical_not(tf.reduce_any(next_legal, axis=[1, 2], keepdims=True)))
+            scores = tf.where(next_legal, scores, tf.fill(tf.shape(scores), -np.inf))
+            best = tf.argmax(tf.reshape(scores, [tf.shape(scores)[0], -1]), axis=1, output_type=tf.int32)
+            columns = tf.shape(next_columns)[0]
+            return best // columns, tf.gather(next_columns, best % columns)
+
+        # One TD update as a single graph: Bellman targets for both heads,
+        # weighted squared error on the taken locations, one optimizer step.
+        # The next state's value is that of the legal pair act would pick
+        # there, so targets follow the policy that acts.
+        # Returns the per transition TD error for the replay priorities.
+        def train_step(states, next_states, currents, next_locs, rewards, dones, next_legal, next_columns, weights):
+            batch = tf.shape(states)[0]
+            not_done = 1.0 - dones
+            target_next = self.target_model(model_inputs(next_states), training=False)
+            with tf.GradientTape() as tape:
+                # Current and next states go through the model in one pass
+                online = self.model(model_inputs(tf.concat([states, next_states], axis=0)), training=True)
+                if double_dqn:
+                    # The model picks the next pair, the target network
+                    # values it
+                    best = best_pairs(tf.stop_gradient(online[0][batch:]), tf.stop_gradient(online[1][batch:]),
+                                      next_legal, next_columns)
+                else:
+                    best = best_pairs(target_next[0], target_next[1], next_legal, next_columns)
+                loss = 0.0
+                td_errors = tf.zeros_like(rewards)
+                for head, taken in enumerate((currents, next_locs)):
+                    next_value = tf.gather(target_next[head], best[head], batch_dims=1)
+                    target = rewards + discount * next_value * not_done
+                    error = target - tf.gather(online[head][:batch], taken, batch_dims=1)
+                    td_errors += tf.abs(error)
+                    loss += tf.reduce_mean(weights * tf.square(error))
+            gradients = tape.gradient(loss, self.model.trainable_variables)
+            optimizer.apply_gradients(zip(gradients, self.model.trainable_variables))
+            return td_errors / 2
+
+        states_spec = tf.TensorSpec((None, 3, 97), tf.int8)
+        self.train_step = tf.function(train_step, input_signature=[
+            states_spec, states_spec,
+            tf.TensorSpec((None,), tf.int32), tf.TensorSpec((None,), tf.int32),
+            tf.TensorSpec((None,), tf.float32), tf.TensorSpec((None,), tf.float32),
+            tf.TensorSpec((None, 97, None), tf.bool), tf.TensorSpec((None,), tf.int32),
+            tf.TensorSpec((None,), tf.float32),
+        ])
+
+    def update_target(self):
+        for target, weight in zip(self.target_model.weights, self.model.weights):
+            target.assign(weight)
+
+    def predict_q(self, states):
+        # Current and next location Q-values for a batch of observations
+        with self.profiler.phase("predict"):
+            states = np.asarray(states, dtype=np.int8)
+            forward = self.predict_single if len(states) == 1 else self.predict_batch
+            current, next_loc = forward(states)
+            return current.numpy(), next_loc.numpy()
+
+    def export_numpy_policy(self, path=None):
+        # Copy of the current network that runs without TensorFlow
+        policy = NumpyPolicy(self.model.get_weights(),
+                             [layer.activation.__name__ for layer in self.model.layers if isinstance(layer, Dense)])
+        if path is not None:
+            policy.save(path)
+        return policy
+
+    def act(self, state):
+        if self.action_selection == "epsilon_greedy" and np.random.random() < self.exploration_rate:
+            # Uniform over the legal moves, no forward pass needed
+            return super().act(state)
+        legal = self.environment.legal_actions()[np.newaxis] if self.legal_moves else None
+        current, next_loc = self.select(self.predict_q(state[np.newaxis]), legal, exploration_rate=0)
+        return {
+            'current_location': current[0],
+            'next_location': next_loc[0]
+        }
+
+    def act_batch(self, states, legal=None):
+        # A single forward pass serves every game in the batch; legal is an
+        # optional (n, 97, 97) mask restricting each game to its legal moves
+        current, next_loc = self.select(self.predict_q(states), legal)
+        return {
+            'current_location': current,
+            'next_location': next_loc
+        }
+
+    def select(self, q_values, legal, exploration_rate=None):
+        # Best or sampled (current, next) pair of every state by the joint
+        # score of both heads, see action_selection.select_actions
+        current, next_loc = q_values
+        return select_actions(current, next_loc, legal, self.action_selection,
+                              self.exploration_rate if exploration_rate is None else exploration_rate,
+                              self.temperature, self.top_k, self.rng)
+
+    def convert_state(self, state):
+        # Environments return the numeric (3, 97) value, suit and color
+        # observation, the network takes each row as a (97, 1) input
+        return np.asarray(state)[..., np.newaxis]
+            
+    def learn(self, state, next_state, action, reward, done, *_):
+        self.total_reward += reward
+        if reward == -1:
+            self.invalid_count += 1
+            self.profiler.count("invalid_moves")
+
+        next_legal = pack_legal(self.environment.legal_actions()) if self.legal_moves else None
+        self.remember(state, next_state, action, reward, done, next_legal)
+
+        if done:
+            self.memory_replay()
+
+    def remember(self, state, next_state, action, reward, done, next_legal=None):
+        # next_legal: the next state's replay.pack_legal mask, None when
+        # moves are not restricted to legal ones
+        self.memories.append(state, next_state, action["current_location"], action["next_location"], reward, done,
+                             next_legal)
+       
+    # Perform a TD update on a prioritized batch of memories
+    def memory_replay(self):
+        if len(self.memories) == 0:
+            return
+        n = min(self.batch_size, len(self.memories))
+        with self.profiler.phase("replay_sample"):
+            states, next_states, currents, next_locs, rewards, dones, next_legal, indices, weights = self.batch_memories(n)
+            if self.legal_moves:
+                # Legal moves only ever land in LEGAL_COLUMNS
+                next_legal = unpack_legal_columns(next_legal)
+                next_columns = np.array(LEGAL_COLUMNS, dtype=np.int32)
+            else:
+                # act picks from every pair, so the targets do too
+                next_legal = np.ones((n, self.action_space, self.action_space), dtype=bool)
+                next_columns = np.arange(self.action_space, dtype=np.int32)
+
+        with self.profiler.phase("train_step"):
+            td_errors = self.train_step(
+                states, next_states,
+                currents.astype(np.int32), next_locs.astype(np.int32),
+                rewards.astype(np.float32), dones.astype(np.float32), next_legal, next_columns,
+                weights.astype(np.float32))
+        self.memories.update_priorities(indices, td_errors.numpy())
+
+        self.replays += 1
+        if self.replays % self.target_update_interval == 0:
+            self.update_target()
+                
+    def batch_memories(self, n):
+        return self.memories.sample(n)
+        
+        
+    def finalize(self, iteration):
+        
+        self.exploration_rate -= self.exploration_decay
+        self.exploration_rate = max(self.exploration_rate, self.min_exploration_rate)
+        won = self.games_won[-1] if self.games_won else 0
+        self.metrics.append(iteration, self.total_reward, self.invalid_count, won)
+
+        if (iteration + 1) % self.plotting_iterations == 0:
+            with self.profiler.phase("plot"):
+                self.plot(iteration + 1)
+            with self.profiler.phase("checkpoint"):
+                self.checkpoint(iteration)
+            self.metrics.flush()
+            self.memories.flush()
+            self.profiler.report(iteration + 1)
+        
+        self.invalid_count = 0
+        self.total_reward = 0
+        
+    def plot(self, iteration):
+        # Rendered off the training loop from a copy of the rolling window
+        file_name = f"{self.image_path}/{iteration}.png"
+        self.file_names.append(file_name)
+        self.background.submit(plot_metrics, file_name, iteration, self.metrics.latest())
+
+    def checkpoint(self, iteration):
+        # Weights are copied here, the file is written in the background
+        self.background.submit(self.checkpoints.save, iteration, self.export_numpy_policy())
+
+    def load_checkpoint(self, path=None):
+        # Newest checkpoint by default, returns the file loaded or None
+        path = path or self.checkpoints.latest()
+        if path is not None:
+            self.model.set_weights(NumpyPolicy.load(path).get_weights())
+            self.update_target()
+        return path
+
+    def close(self):
+        # Waits for pending plots and checkpoints
+        self.background.close()
+        self.metrics.flush()
+        self.memories.flush()
+
+    def export_model(self, iteration):
+        # Full SavedModel with the optimizer, for use outside this repo
+        export_path = os.path.join(self.model_directory, str(iteration))
+        tf.keras.models.save_model(
+            self.model,
+            export_path,
+            overwrite=True,
+            include_optimizer=True,
+            save_format=None,
+            signatures=None,
+            options=None
+        )
\ No newline at end of file
@@ -0,0 +1,176 @@
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import sys
+import time
+import numpy as np
+
+from action_selection import select_actions
+from card_elements import CARD_COUNT
+from compact_game import CompactGame, PILE_STRIDE, FOUNDATIONS
+from deals import benchmark_deals, make_corpus
+from numpy_policy import NumpyPolicy
+from rules import MODES
+
+# Two sided 95% normal quantile
+Z = 1.96
+
+# Policy of the current worker process, set by init_worker
+worker_policy = None
+
+
+def load_policy(path):
+    """
+    NumpyPolicy for a checkpoint: an .npz written by CheckpointManager or
+    NumpyPolicy.save, or a SavedModel directory from
+    DeepQNetwork.export_model (loading that needs TensorFlow, only here in
+    the parent process). "random" gives None, the RandomAgent policy.
+    """
+    if path == "random":
+        return None
+    if os.path.isdir(path):
+        import tensorflow as tf
+        from tensorflow.keras.layers import Dense
+
+        model = tf.keras.models.load_model(path)
+        return NumpyPolicy(model.get_weights(),
+                           [layer.activation.__name__ for layer in model.layers if isinstance(layer, Dense)])
+    return NumpyPolicy.load(path)
+
+
+def init_worker(policy):
+    global worker_policy
+    worker_policy = policy
+
+
+def play_deals(deals, max_steps=300, legal_moves=True, seed=0, rules=None):
+    """
+    Plays every deal greedily with the worker's policy under rules, all
+    games stepping together so one forward pass serves the whole chunk.
+    The random policy picks uniformly, among the legal moves when
+    legal_moves is set. With legal_moves a game left without a legal move
+    stops there, lost, rather than stepping on to max_steps. Returns (won,
+    score, moves, invalid) per deal.
+    """
+    rng = np.random.default_rng(seed)
+    games = []
+    for deal in deals:
+        game = CompactGame(rules=rules)
+        game.deal(bytes(deal))
+        games.append(game)
+    results = [[False, game.score, 0, 0] for game in games]
+    active = list(range(len(games)))
+
+    for _ in range(max_steps):
+        if not active:
+            break
+        legal = None
+        if legal_moves:
+            legal = np.stack([games[index].legal_actions() for index in active])
+            playable = legal.any(axis=(1, 2))
+            if not playable.all():
+                active = [index for index, alive in zip(active, playable) if alive]
+                legal = legal[playable]
+                if not active:
+                    break
+        if worker_policy is None:
+            zeros = np.zeros((len(active), games[0].action_space))
+            current, next_loc = select_actions(zeros, zeros, legal, "epsilon_greedy", 1.0, rng=rng)
+        else:
+            current_q, next_q = worker_policy.predict(np.stack([games[index].observation for index in active]))
+            current, next_loc = select_actions(current_q, next_q, legal, "greedy")
+
+        still_active = []
+        for index, current_location, next_location in zip(active, current, next_loc):
+            game = games[index]
+            result = results[index]
+            _, reward, _, info = game.step({'current_location': int(current_location), 'next_location': int(next_location)})
+            result[1] = game.score
+            result[2] += 1
+            if reward == -1:
+                result[3] += 1
+            if sum(game.board[pile * PILE_STRIDE] for pile in FOUNDATIONS) == CARD_COUNT:
+                result[0] = True
+            elif not info["truncated"]:
+                still_active.append(index)
+        active = still_active
+    return [tuple(result) for result in results]
+
+
+def proportion_interval(successes, trials):
+    # Wilson score interval, sound near 0 and 1 where the normal one is not
+    if trials == 0:
+        return 0.0, 0.0, 0.0
+    rate = successes / trials
+    center = (rate + Z * Z / (2 * trials)) / (1 + Z * Z / trials)
+    spread = Z * math.sqrt(rate * (1 - rate) / trials + Z * Z / (4 * trials * trials)) / (1 + Z * Z / trials)
+    return rate, center - spread, center + spread
+
+
+def mean_interval(values):
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(values.mean())
+    spread = Z * float(values.std(ddof=1)) / math.sqrt(len(values)) if len(values) > 1 else 0.0
+    return mean, mean - spread, mean + spread
+
+
+def summarize(results):
+    won, score, moves, invalid = (np.array(column) for column in zip(*results))
+    return {
+        "games": len(results),
+        "win_rate": proportion_interval(int(won.sum()), len(results)),
+        "score": mean_interval(score),
+        "moves": mean_interval(moves),
+        "invalid_rate": proportion_interval(int(invalid.sum()), int(moves.sum())),
+    }
+
+
+def evaluate(policy, deals, max_steps=300, legal_moves=True, workers=None, chunk_size=64, seed=0, rules=None):
+    """
+    Plays deals across a process pool, chunk_size deals per task, and
+    returns summarize's statistics: (value, low, high) 95% intervals for
+    the win rate, mean score, mean moves per game and invalid move rate.
+    """
+    chunks = [deals[start:start + chunk_size] for start in range(0, len(deals), chunk_size)]
+    tasks = [([bytes(deal) for deal in chunk], max_steps, legal_moves, seed + index, rules)
+             for index, chunk in enumerate(chunks)]
+    with mp.Pool(workers or os.cpu_count(), initializer=init_worker, initargs=(policy,)) as pool:
+        results = [result for chunk in pool.starmap(play_deals, tasks) for result in chunk]
+    return summarize(results)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Win rate of a checkpoint playing fixed deals greedily")
+    parser.add_argument("checkpoint", help="weights .npz, export_model directory or 'random'")
+    parser.add_argument("--deals", type=int, default=None,
+                        help="play this many deals from --seed instead of the benchmark deals")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-steps", type=int, default=300)
+    parser.add_argument("--rules", choices=sorted(MODES), default="draw1", help="variant to play, see rules.py")
+    parser.add_argument("--no-legal-moves", dest="legal_moves", action="store_false",
+                        help="let the policy pick illegal moves instead of masking them")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="where the JSON report is written")
+    options = parser.parse_args(arguments)
+
+    deals = benchmark_deals() if options.deals is None else make_corpus(options.deals, options.seed)
+    started = time.perf_counter()
+    report = evaluate(load_policy(options.checkpoint), deals, options.max_steps, options.legal_moves,
+                      options.workers, seed=options.seed, rules=MODES[options.rules])
+    report["seconds"] = time.perf_counter() - started
+    report["settings"] = vars(options)
+
+    print("{0} games in {1:.1f}s".format(report["games"], report["seconds"]))
+    for name in ("win_rate", "score", "moves", "invalid_rate"):
+        value, low, high = report[name]
+        print("{0:>12}: {1:.4f}  [{2:.4f}, {3:.4f}]".format(name, value, low, high))
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,126 @@
+import json
+import numpy as np
+
+# Event types in the order of their binary codes
+EVENT_TYPES = (
+    "reset",
+    "win",
+    "flip",
+    "pile_pile",
+    "discard_pile",
+    "pile_foundation",
+    "discard_foundation",
+    "foundation_pile",
+    "discard_deck",
+    "deck_discard",
+)
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+# Card id used when an event has no single card (reset, win, discard_deck)
+NO_CARD = 255
+
+# One binary record: event code, source pile, destination pile, card id
+EVENT_DTYPE = np.dtype([("event", "u1"), ("source", "u1"), ("destination", "u1"), ("card", "u1")])
+
+
+class NullEventSink(object):
+    """
+    Event sink that drops everything, the default for Game. Sinks receive
+    one record per move or flip: the event type from EVENT_TYPES, the
+    source and destination pile numbers and the card id moved (the deepest
+    card of a moved run), or NO_CARD.
+    """
+
+    def record(self, event, source, destination, card=NO_CARD):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class PrintEventSink(NullEventSink):
+    # Human readable output, what Game used to print on every move
+    def record(self, event, source, destination, card=NO_CARD):
+        if event == "win":
+            print("You won!")
+        elif event == "flip":
+            print("Flipping card", card_name(card), "on", source)
+        elif event == "discard_deck":
+            print("Moving cards from Discard to Deck")
+        elif event != "reset":
+            print("Moving card", card_name(card), " from ", source, " to ", destination)
+
+
+class JsonlEventWriter(NullEventSink):
+    """
+    Buffers events and appends them to a JSON lines file, one object per
+    event, every buffer_size events and on close.
+    """
+
+    def __init__(self, path, buffer_size=1024):
+        self.file = open(path, "a")
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def record(self, event, source, destination, card=NO_CARD):
+        self.buffer.append((event, source, destination, card))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.writelines(
+            json.dumps({"event": event, "source": source, "destination": destination, "card": card}) + "\n"
+            for event, source, destination, card in self.buffer)
+        self.file.flush()
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class BinaryEventWriter(NullEventSink):
+    """
+    Buffers events as 4 byte EVENT_DTYPE records and appends them to a
+    binary file, read back with read_events.
+    """
+
+    def __init__(self, path, buffer_size=4096):
+        self.file = open(path, "ab")
+        self.buffer_bytes = buffer_size * EVENT_DTYPE.itemsize
+        self.buffer = bytearray()
+
+    def record(self, event, source, destination, card=NO_CARD):
+        self.buffer += bytes((EVENT_CODES[event], source, destination, card))
+        if len(self.buffer) >= self.buffer_bytes:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_events(path):
+    # Structured array of the records written by BinaryEventWriter
+    return np.fromfile(path, dtype=EVENT_DTYPE)
+
+
+def card_name(card):
+    if card == NO_CARD:
+        return ""
+    suit = (u'\u2660', u'\u2665', u'\u2663', u'\u2666')[card // 13]
+    return "{0} {1}".format(suit, card % 13 + 1)
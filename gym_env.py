@@ -0,0 +1,172 @@
+import pprint
+import numpy as np
+import gymnasium as gym
+from gymnasium import spaces
+
+from card_elements import CARD_COUNT
+from compact_game import CompactGame, FOUNDATIONS
+from vec_game import VecGame
+
+LOCATIONS = 97
+
+# Highest value in the (3, 97) observation: card values 1 - 13, suits 1 - 4
+# and colors 1 - 2, 0 for an empty slot
+OBSERVATION_SPACE = spaces.Box(low=0, high=13, shape=(3, LOCATIONS), dtype=np.int8)
+
+
+def action_space(action_mode):
+    # "flat": one Discrete(97 * 97) action, current * 97 + next
+    # "factored": MultiDiscrete([97, 97]), current and next location
+    if action_mode == "flat":
+        return spaces.Discrete(LOCATIONS * LOCATIONS)
+    if action_mode == "factored":
+        return spaces.MultiDiscrete([LOCATIONS, LOCATIONS])
+    raise ValueError("action_mode must be 'flat' or 'factored', not {0!r}".format(action_mode))
+
+
+def decode_actions(actions, action_mode):
+    # Location arrays for a batch of actions in either mode
+    actions = np.asarray(actions)
+    if action_mode == "flat":
+        return np.divmod(actions, LOCATIONS)
+    return actions[..., 0], actions[..., 1]
+
+
+class SolitaireEnv(gym.Env):
+
+    """
+    Description:
+        Gymnasium environment around a Game engine (CompactGame by
+        default, Game works the same way).
+
+        Observation:
+            The engine's (3, 97) int8 value, suit and color observation.
+
+        Actions:
+            Discrete(9409) in the "flat" mode or MultiDiscrete([97, 97]) in
+            the "factored" mode, see action_space.
+
+        Reward:
+            The engine's reward, -1 for invalid moves, plus 1 on the move
+            that wins the game, as in VecGame.
+
+        Episode Termination:
+            terminated on the move that puts the last card on a
+            foundation, truncated after max_steps steps or at the rules'
+            step cap.
+
+        rules (rules.py) picks the variant the engine plays: draw 1 or 3,
+        pass limit, scoring and step cap. info["score"] is the game score.
+
+        info["action_mask"] is the flat int8 mask of the 9409 moves the
+        engine would accept, also available as action_masks(). It costs a
+        legal_actions call per step, legal_mask=False turns it off.
+
+        reset(seed=...) seeds the engine's deal generator and
+        reset(options={"deal": deal}) plays a 52 byte deal from deals.py.
+    """
+
+    metadata = {"render_modes": ["ansi"]}
+
+    def __init__(self, engine=CompactGame, action_mode="flat", max_steps=300, legal_mask=True, render_mode=None,
+                 rules=None):
+        self.game = engine(rules=rules)
+        self.action_mode = action_mode
+        self.max_steps = max_steps
+        self.legal_mask = legal_mask
+        self.render_mode = render_mode
+        self.observation_space = OBSERVATION_SPACE
+        self.action_space = action_space(action_mode)
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        if options is not None and "deal" in options:
+            self.game.deal(options["deal"])
+            observation = self.game.observation.copy()
+        else:
+            observation = self.game.reset(seed=seed)
+        return observation, self.info()
+
+    def step(self, action):
+        current, next_loc = decode_actions(action, self.action_mode)
+        observation, reward, done, engine_info = self.game.step({'current_location': int(current), 'next_location': int(next_loc)})
+        # The engine only notices a win at the start of the next step
+        terminated = done or self.won()
+        if terminated and not done:
+            reward += 1
+        truncated = not terminated and (engine_info["truncated"] or
+                                        (self.max_steps is not None and self.game.count >= self.max_steps))
+        return observation, float(reward), terminated, truncated, self.info()
+
+    def won(self):
+        return sum(self.game.pile_size(pile) for pile in FOUNDATIONS) == CARD_COUNT
+
+    def info(self):
+        if not self.legal_mask:
+            return {"score": self.game.score}
+        return {"action_mask": self.action_masks().astype(np.int8), "score": self.game.score}
+
+    def action_masks(self):
+        return self.game.legal_actions().ravel()
+
+    def render(self):
+        if self.render_mode == "ansi":
+            return pprint.pformat(self.game.get_game_elements())
+
+
+class SolitaireVectorEnv(gym.vector.VectorEnv):
+
+    """
+    Gymnasium vector environment stepping num_envs games at once with
+    VecGame. Finished games are dealt again inside the same step, so the
+    observation returned for them is the first of their next game
+    (autoreset mode SAME_STEP). As in Gymnasium's SyncVectorEnv, their
+    last observation is in infos["final_obs"] and the "won" and "valid"
+    values of their last step in infos["final_info"], both masked by
+    "_final_obs" / "_final_info". infos also holds "won" and "valid" for
+    every game.
+
+    VecGame has no legal move masks; for masked vector envs use
+    make_async_env, which runs SolitaireEnv copies in worker processes.
+    """
+
+    metadata = {"autoreset_mode": gym.vector.AutoresetMode.SAME_STEP}
+
+    def __init__(self, num_envs, action_mode="flat", max_steps=300, seed=None):
+        self.games = VecGame(num_envs, max_steps=max_steps, seed=seed)
+        self.num_envs = num_envs
+        self.action_mode = action_mode
+        self.single_observation_space = OBSERVATION_SPACE
+        self.single_action_space = action_space(action_mode)
+        self.observation_space = gym.vector.utils.batch_space(self.single_observation_space, num_envs)
+        self.action_space = gym.vector.utils.batch_space(self.single_action_space, num_envs)
+
+    def reset(self, seed=None, options=None):
+        if seed is not None:
+            self.games.rng = np.random.default_rng(seed)
+        return self.games.reset(), {}
+
+    def step(self, actions):
+        current, next_loc = decode_actions(actions, self.action_mode)
+        observations, rewards, dones, info = self.games.step({'current_location': current, 'next_location': next_loc})
+        won = info["won"]
+        infos = {"won": won, "valid": info["valid"]}
+        if dones.any():
+            final_obs = np.full(self.num_envs, None, dtype=object)
+            for index, observation in zip(np.flatnonzero(dones), info["final_observations"]):
+                final_obs[index] = observation
+            infos.update({
+                "final_obs": final_obs,
+                "_final_obs": dones,
+                "final_info": {"won": won & dones, "_won": dones, "valid": info["valid"] & dones, "_valid": dones},
+                "_final_info": dones,
+            })
+        return observations, rewards, won, dones & ~won, infos
+
+
+def make_async_env(num_envs, **kwargs):
+    # SolitaireEnv copies in worker processes, with legal move masks
+    return gym.vector.AsyncVectorEnv([lambda: SolitaireEnv(**kwargs) for _ in range(num_envs)])
+
+
+gym.register(id="Solitaire-v0", entry_point="gym_env:SolitaireEnv")
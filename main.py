@@ -1,43 +1,75 @@
-import numpy as np
 import pprint
 from agents import RandomAgent, DeepQNetwork
 pp = pprint.PrettyPrinter(indent=2)
 
 from solitaire import Game
+from rules import Rules
 
-env = Game()
+# Draw one, unlimited passes, standard scoring, 300 steps a game; other
+# variants, e.g. Rules(draw=3, passes=3, scoring="vegas", max_steps=300)
+# or rules.MODES["vegas3"], are played the same way
+rules = Rules(max_steps=300)
+env = Game(rules=rules)
+# from compact_game import CompactGame
+# env = CompactGame(rules=rules)
+# Moves are not reported by default, to print or log them:
+# from events import PrintEventSink, BinaryEventWriter
+# env.events = PrintEventSink()
+# env.events = BinaryEventWriter("moves.bin")
+# Easy deals first, from a table built by python curriculum.py:
+# from curriculum import CurriculumDeals, linear_schedule
+# env.deals = CurriculumDeals("./curriculum", linear_schedule(10, 20000))
+
+# To keep every episode for offline training, uncomment the trajectory lines
+# from trajectory import TrajectoryWriter
+# trajectory = TrajectoryWriter("episodes.traj")
 
 # agent = RandomAgent(env)
-agent = DeepQNetwork(env)
+agent = DeepQNetwork(env, legal_moves=True)
+
+# To play games in worker processes on every core instead: python rollout.py
 
+# Time spent per phase, DeepQNetwork prints it with every plot
+profiler = agent.profiler
+# To also sample which functions the time goes to:
+# profiler.start_sampling()
 
 for iteration in range(20000):
     
-    state = env.reset()
+    with profiler.phase("env_reset"):
+        state = env.reset()
     done = False
-    print("Iteration", iteration)
+    truncated = False
+    # trajectory.begin_episode(env.deal_order, state)
     # pp.pprint(env.get_game_elements())
     # env.print_in_order()
     
-    while not done and env.count < 300:
+    while not done and not truncated:
         
-        action = agent.act(state)
-        next_state, reward, done, _ = env.step(action)
-        agent.learn(state, next_state, action, reward, done)
+        with profiler.phase("act"):
+            action = agent.act(state)
+        with profiler.phase("env_step"):
+            next_state, reward, done, info = env.step(action)
+        truncated = info["truncated"]
+        with profiler.phase("learn"):
+            agent.learn(state, next_state, action, reward, done)
+        # trajectory.record(action, reward, done, next_state)
         
         state = next_state
+    # trajectory.end_episode()
     # print(agent.total_reward)
     if done:
         agent.games_won.append(1)
     else:
         agent.games_won.append(0)
     if iteration % 250 == 0:
+        print("Iteration", iteration)
         pp.pprint(env.get_game_elements())
-    agent.finalize(iteration)
+    with profiler.phase("finalize"):
+        agent.finalize(iteration)
     # print("End Game")
     
 # env.close()
-
-
-    
-    
\ No newline at end of file
+env.events.close()
+# trajectory.close()
+agent.close()
@@ -0,0 +1,171 @@
+import glob
+import os
+import queue
+import threading
+import traceback
+import numpy as np
+
+# Columns of MetricLog, one row per training iteration
+METRIC_FIELDS = ("iteration", "reward", "average_reward", "invalid_moves", "won")
+
+
+class BackgroundWorker(object):
+    """
+    Single daemon thread running submitted calls in order, so plotting and
+    checkpoint writes happen off the training loop. The queue is bounded:
+    if the thread falls behind, submit blocks instead of piling up work.
+    A failing call is printed and the thread carries on.
+    """
+
+    def __init__(self, max_pending=4):
+        self.tasks = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            function, arguments = task
+            try:
+                function(*arguments)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.tasks.task_done()
+
+    def submit(self, function, *arguments):
+        self.tasks.put((function, arguments))
+
+    def join(self):
+        # Waits for everything submitted so far
+        self.tasks.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.tasks.put(None)
+            self.thread.join()
+
+
+class MetricLog(object):
+    """
+    Per-iteration training metrics kept in fixed size rolling arrays of
+    the last window iterations, with every row also appended to a CSV
+    stream on disk every flush_every rows. average_reward is the mean
+    reward of the last average_over iterations, kept as a running sum.
+    """
+
+    def __init__(self, path="metrics.csv", window=5000, average_over=250, flush_every=250):
+        self.path = path
+        self.window = window
+        self.average_over = average_over
+        self.flush_every = flush_every
+        self.rows = np.zeros((window, len(METRIC_FIELDS)), dtype=np.float64)
+        self.size = 0
+        self.recent = np.zeros(average_over, dtype=np.float64)
+        self.recent_sum = 0.0
+        self.pending = []
+        if path is not None and not os.path.exists(path):
+            with open(path, "w") as metric_file:
+                metric_file.write(",".join(METRIC_FIELDS) + "\n")
+
+    def __len__(self):
+        return self.size
+
+    def append(self, iteration, reward, invalid_moves, won):
+        slot = self.size % self.average_over
+        self.recent_sum += reward - self.recent[slot]
+        self.recent[slot] = reward
+        average = self.recent_sum / min(self.size + 1, self.average_over)
+
+        row = (iteration, reward, average, invalid_moves, won)
+        self.rows[self.size % self.window] = row
+        self.size += 1
+        self.pending.append(row)
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def latest(self):
+        # The rolling window as a copy, oldest row first
+        if self.size <= self.window:
+            return self.rows[:self.size].copy()
+        return np.roll(self.rows, -(self.size % self.window), axis=0)
+
+    def flush(self):
+        if self.path is not None and self.pending:
+            with open(self.path, "a") as metric_file:
+                metric_file.writelines(",".join("{0:g}".format(value) for value in row) + "\n" for row in self.pending)
+        self.pending = []
+
+
+def plot_metrics(file_name, iteration, rows):
+    # Renders the three panel training figure for the rows of a MetricLog.
+    # Uses a Figure with the Agg canvas rather than pyplot, which is not
+    # safe to drive from a background thread.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    columns = dict(zip(METRIC_FIELDS, rows.T))
+    iterations = columns["iteration"]
+    fig = Figure(figsize=(20, 4), facecolor="white")
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(wspace=1)
+    fig.suptitle(f"Iteration {iteration}")
+
+    reward = fig.add_subplot(1, 3, 1)
+    reward.plot(iterations, columns["reward"], c="k")
+    reward.plot(iterations, columns["average_reward"], c="r", linewidth=2)
+    reward.set_title("Rewards over time")
+    reward.set_xlabel("iterations")
+    reward.set_ylabel("reward")
+    reward.set_ylim([-300, 100])
+
+    invalid_move = fig.add_subplot(1, 3, 2)
+    invalid_move.plot(iterations, columns["invalid_moves"], c="k")
+    invalid_move.set_title("Invalid Moves over time")
+    invalid_move.set_xlabel("Iterations")
+    invalid_move.set_ylabel("Number of Invalid Moves")
+    invalid_move.set_ylim([0, 300])
+
+    won_games = fig.add_subplot(1, 3, 3)
+    won_games.plot(iterations, columns["won"], c="k")
+    won_games.set_title("Games won")
+    won_games.set_xlabel("Iteration")
+    won_games.set_ylabel("Game Won")
+    won_games.set_ylim([0, 1])
+
+    fig.savefig(file_name)
+
+
+class CheckpointManager(object):
+    """
+    Weights-only checkpoints, one NumpyPolicy .npz file per save named by
+    iteration, so a checkpoint loads with NumpyPolicy.load as well as into
+    the Keras model. Only the newest keep files are kept.
+    """
+
+    def __init__(self, directory="./model_dir", keep=5):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, iteration):
+        return os.path.join(self.directory, "weights_{0:08d}.npz".format(iteration))
+
+    def checkpoints(self):
+        return sorted(glob.glob(os.path.join(self.directory, "weights_*.npz")))
+
+    def save(self, iteration, policy):
+        # Written under a temporary name first so a crash never leaves a
+        # half written newest checkpoint
+        path = self.path(iteration)
+        temporary = os.path.join(self.directory, "partial_" + os.path.basename(path))
+        policy.save(temporary)
+        os.replace(temporary, path)
+        for old in self.checkpoints()[:-self.keep]:
+            os.remove(old)
+
+    def latest(self):
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
@@ -0,0 +1,77 @@
+import random
+import numpy as np
+
+from action_selection import select_actions
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+}
+
+
+class NumpyPolicy(object):
+    """
+    Forward pass of the DeepQNetwork model in plain NumPy, for processes
+    that should not import TensorFlow (rollout workers, evaluation).
+
+    The network is the one DeepQNetwork.build_model creates: value, suit
+    and color rows concatenated into 291 inputs, a dense 256 -> 64 trunk and
+    two 97 wide heads for the current and next location. Weights come from
+    DeepQNetwork.export_numpy_policy or model.get_weights().
+    """
+
+    def __init__(self, weights, activations=("tanh", "tanh", "linear", "linear")):
+        kernels = [np.asarray(weight, dtype=np.float32) for weight in weights[0::2]]
+        biases = [np.asarray(weight, dtype=np.float32) for weight in weights[1::2]]
+        self.activations = tuple(activations)
+        layers = [(kernel, bias, ACTIVATIONS[activation])
+                  for kernel, bias, activation in zip(kernels, biases, self.activations)]
+        self.trunk = layers[:-2]
+        self.heads = layers[-2:]
+        self.action_space = self.heads[0][1].shape[0]
+
+    def predict(self, states):
+        # states: (n, 3, 97) observations, returns the (n, 97) current and
+        # next location Q-values
+        states = np.asarray(states, dtype=np.float32)
+        hidden = states.reshape(len(states), -1)
+        for kernel, bias, activation in self.trunk:
+            hidden = activation(hidden @ kernel + bias)
+        return tuple(activation(hidden @ kernel + bias) for kernel, bias, activation in self.heads)
+
+    def act(self, state, exploration_rate=0.0, legal=None):
+        # legal, an optional (97, 97) legal move mask, restricts the greedy
+        # pair to legal moves
+        if legal is not None:
+            current, next_loc = select_actions(*self.predict(state[np.newaxis]), legal=legal[np.newaxis],
+                                               epsilon=exploration_rate)
+            return {
+                'current_location': int(current[0]),
+                'next_location': int(next_loc[0])
+            }
+        if random.random() < exploration_rate:
+            return {
+                'current_location': random.randrange(0, self.action_space),
+                'next_location': random.randrange(0, self.action_space)
+            }
+        current, next_loc = self.predict(state[np.newaxis])
+        return {
+            'current_location': int(np.argmax(current)),
+            'next_location': int(np.argmax(next_loc))
+        }
+
+    def get_weights(self):
+        weights = []
+        for kernel, bias, _ in self.trunk + self.heads:
+            weights += [kernel, bias]
+        return weights
+
+    def save(self, path):
+        np.savez(path, *self.get_weights(), activations=np.array(self.activations))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            weights = [saved["arr_{0}".format(index)] for index in range(len(saved.files) - 1)]
+            return cls(weights, [str(activation) for activation in saved["activations"]])
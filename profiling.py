@@ -0,0 +1,117 @@
+import json
+import signal
+import sys
+import time
+from collections import Counter
+
+
+class Phase(object):
+    # Reusable context manager adding its elapsed time to one phase
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.profiler.totals[self.name] += time.perf_counter() - self.start
+        self.profiler.calls[self.name] += 1
+
+
+class Profiler(object):
+    """
+    Cumulative wall time per phase of the training loop and plain event
+    counters, cheap enough to leave on (about a microsecond per phase).
+
+        with profiler.phase("env_step"):
+            env.step(action)
+        profiler.count("invalid_moves")
+
+    A phase object is made once per name and reused, so the same phase
+    must not be nested inside itself. summary() and report() give the
+    totals since the last reset, report() also appends them as one JSON
+    line to path.
+
+    start_sampling() turns on a SIGPROF sampling profiler that records the
+    function running every interval seconds of CPU time, listed by
+    report() until stop_sampling(). Only on platforms with setitimer.
+    """
+
+    def __init__(self, path="profile.jsonl"):
+        self.path = path
+        self.phases = {}
+        self.totals = Counter()
+        self.calls = Counter()
+        self.counters = Counter()
+        self.samples = Counter()
+        self.sampling = False
+        self.started = time.perf_counter()
+
+    def phase(self, name):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase(self, name)
+        return phase
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "elapsed": elapsed,
+            "phases": {name: {"seconds": self.totals[name], "calls": self.calls[name],
+                              "share": self.totals[name] / elapsed if elapsed > 0 else 0.0}
+                       for name in sorted(self.totals, key=self.totals.get, reverse=True)},
+            "counters": dict(self.counters),
+            "samples": dict(self.samples.most_common(20)),
+        }
+
+    def report(self, iteration, reset=True):
+        summary = self.summary()
+        summary["iteration"] = iteration
+        print("Profile at iteration {0}, {1:.1f}s".format(iteration, summary["elapsed"]))
+        for name, phase in summary["phases"].items():
+            print("  {0:<16} {1:>9.2f}s {2:>6.1%} {3:>10} calls".format(name, phase["seconds"], phase["share"], phase["calls"]))
+        for name, value in summary["counters"].items():
+            print("  {0:<16} {1:>10}".format(name, value))
+        for name, value in summary["samples"].items():
+            print("  {0:<50} {1:>6} samples".format(name, value))
+        if self.path is not None:
+            with open(self.path, "a") as profile_file:
+                profile_file.write(json.dumps(summary) + "\n")
+        if reset:
+            self.reset()
+        return summary
+
+    def reset(self):
+        self.totals.clear()
+        self.calls.clear()
+        self.counters.clear()
+        self.samples.clear()
+        self.started = time.perf_counter()
+
+    def start_sampling(self, interval=0.005):
+        if not hasattr(signal, "setitimer"):
+            print("Sampling profiler needs signal.setitimer, not available on", sys.platform)
+            return
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        self.sampling = True
+
+    def stop_sampling(self):
+        if self.sampling:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+            self.sampling = False
+
+    def sample(self, _, frame):
+        # Runs in the main thread between bytecodes, frame is what was running
+        if frame is not None:
+            code = frame.f_code
+            self.samples["{0}:{1}".format(code.co_filename.rsplit("/", 1)[-1], code.co_name)] += 1
@@ -0,0 +1,295 @@
+import json
+import os
+import numpy as np
+
+from solitaire import TARGET_LOCATIONS
+
+# Legal moves of a next state are kept as its legal mask in the columns a
+# move can land in (TARGET_LOCATIONS, the only ones legal_actions marks),
+# bit packed to 2 bytes per location
+LEGAL_COLUMNS = TARGET_LOCATIONS
+PACKED_LEGAL_SHAPE = (97, 2)
+# Stored when no mask is given: every move counts as legal
+ALL_LEGAL = np.full(PACKED_LEGAL_SHAPE, 0xFF, dtype=np.uint8)
+
+
+def pack_legal(legal):
+    # (..., 97, 97) legal mask to its packed (..., 97, 2) form
+    return np.packbits(np.asarray(legal, dtype=bool)[..., LEGAL_COLUMNS], axis=-1)
+
+
+def unpack_legal_columns(packed):
+    # The (..., 97, 13) mask of the LEGAL_COLUMNS only
+    return np.unpackbits(packed, axis=-1, count=len(LEGAL_COLUMNS)).astype(bool)
+
+
+def unpack_legal(packed, locations=97):
+    legal = np.zeros(packed.shape[:-1] + (locations,), dtype=bool)
+    legal[..., LEGAL_COLUMNS] = unpack_legal_columns(packed)
+    return legal
+
+
+def transition_fields(state_shape):
+    # (name, dtype, shape) of every array a replay buffer stores
+    return [
+        ("states", np.int8, state_shape),
+        ("next_states", np.int8, state_shape),
+        ("currents", np.int16, ()),
+        ("next_locs", np.int16, ()),
+        ("rewards", np.float32, ()),
+        ("dones", bool, ()),
+        ("next_legal", np.uint8, PACKED_LEGAL_SHAPE),
+    ]
+
+
+class SumTree(object):
+    """
+    Binary tree over a fixed number of priorities where every node holds
+    the sum of its children, stored as one flat array with the leaves at
+    the end. Updates and prefix-sum lookups touch one node per level and
+    are done for a whole batch of indices at once.
+    """
+
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves - 1, dtype=np.float64)
+
+    def total(self):
+        return self.tree[0]
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.leaves - 1]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.leaves - 1
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = (nodes - 1) // 2
+            # Recomputing parents from both children keeps repeated
+            # indices in one batch correct
+            self.tree[nodes] = self.tree[2 * nodes + 1] + self.tree[2 * nodes + 2]
+
+    def find(self, values):
+        # Leaf index for each value in [0, total), walking down the tree
+        values = np.array(values, dtype=np.float64)
+        nodes = np.zeros(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes + 1
+            go_right = values >= self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - (self.leaves - 1)
+
+
+class ReplayBuffer(object):
+    """
+    Ring buffer of transitions kept in preallocated NumPy arrays, one array
+    per field, so storing is a handful of slice assignments and sampling a
+    batch is one gather per field.
+    """
+
+    def __init__(self, capacity, state_shape=(3, 97)):
+        self.capacity = capacity
+        self.fields = transition_fields(state_shape)
+        for name, dtype, shape in self.fields:
+            setattr(self, name, np.zeros((capacity,) + shape, dtype=dtype))
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, state, next_state, current, next_loc, reward, done, next_legal=None):
+        # next_legal is the next state's pack_legal mask, None for all legal
+        index = self.position
+        self.states[index] = state
+        self.next_states[index] = next_state
+        self.currents[index] = current
+        self.next_locs[index] = next_loc
+        self.rewards[index] = reward
+        self.dones[index] = done
+        self.next_legal[index] = ALL_LEGAL if next_legal is None else next_legal
+        self.position = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return index
+
+    def sample_indices(self, batch_size):
+        indices = np.random.randint(0, self.size, batch_size)
+        return indices, np.ones(batch_size, dtype=np.float32)
+
+    def sample(self, batch_size):
+        # Returns states, next_states, currents, next_locs, rewards, dones,
+        # the packed next state legal masks, the sampled indices and their
+        # importance weights
+        indices, weights = self.sample_indices(batch_size)
+        return (
+            self.states[indices],
+            self.next_states[indices],
+            self.currents[indices],
+            self.next_locs[indices],
+            self.rewards[indices],
+            self.dones[indices],
+            self.next_legal[indices],
+            indices,
+            weights,
+        )
+
+    def update_priorities(self, indices, td_errors):
+        pass
+
+    def flush(self):
+        pass
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer sampling transitions in proportion to their TD error
+    (Schaul et al., Prioritized Experience Replay). New transitions get the
+    highest priority seen so far so they are replayed at least once.
+    """
+
+    def __init__(self, capacity, state_shape=(3, 97), alpha=0.6, beta=0.4, beta_increment=1e-5, epsilon=1e-3):
+        super().__init__(capacity, state_shape)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.priorities = SumTree(capacity)
+
+    def append(self, state, next_state, current, next_loc, reward, done, next_legal=None):
+        index = super().append(state, next_state, current, next_loc, reward, done, next_legal)
+        self.priorities.update([index], [self.max_priority])
+        return index
+
+    def sample_indices(self, batch_size):
+        # One value per equal slice of the total so the batch is spread
+        # over the whole distribution
+        total = self.priorities.total()
+        bounds = np.linspace(0, total, batch_size + 1)
+        values = np.random.uniform(bounds[:-1], bounds[1:])
+        indices = np.minimum(self.priorities.find(values), self.size - 1)
+
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        probabilities = self.priorities.get(indices) / total
+        weights = (self.size * probabilities) ** -self.beta
+        return indices, (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.priorities.update(indices, priorities)
+
+
+class MemmapReplayBuffer(ReplayBuffer):
+    """
+    Unbounded replay store kept on disk. Transitions are appended to
+    segments of segment_size rows, each field a memory-mapped .npy file in
+    its own segment directory, and a small replay.json records how many
+    rows are filled. Opening an existing directory picks up where the last
+    run stopped, so experience can be kept across runs or shared read-only
+    between experiments.
+    """
+
+    def __init__(self, directory, segment_size=1000000, state_shape=(3, 97), read_only=False):
+        self.directory = directory
+        self.read_only = read_only
+        self.metadata_path = os.path.join(directory, "replay.json")
+        self.segment_size = segment_size
+        self.state_shape = tuple(state_shape)
+        self.size = 0
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+            self.segment_size = metadata["segment_size"]
+            self.size = metadata["size"]
+            if tuple(metadata["state_shape"]) != self.state_shape:
+                raise ValueError("Replay store {0} holds states of shape {1}".format(directory, metadata["state_shape"]))
+        elif read_only:
+            raise FileNotFoundError(self.metadata_path)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        self.fields = transition_fields(self.state_shape)
+        self.segments = [self.open_segment(segment) for segment in range(-(-self.size // self.segment_size))]
+
+    @property
+    def capacity(self):
+        return len(self.segments) * self.segment_size
+
+    def open_segment(self, segment):
+        path = os.path.join(self.directory, "segment_{0:05d}".format(segment))
+        arrays = {}
+        if self.read_only:
+            mode = "r"
+        elif os.path.exists(path):
+            mode = "r+"
+        else:
+            os.makedirs(path)
+            mode = "w+"
+        for name, dtype, shape in self.fields:
+            arrays[name] = np.lib.format.open_memmap(
+                os.path.join(path, name + ".npy"), mode=mode,
+                dtype=dtype, shape=(self.segment_size,) + shape if mode == "w+" else None)
+        return arrays
+
+    def append(self, state, next_state, current, next_loc, reward, done, next_legal=None):
+        return self.extend([state], [next_state], [current], [next_loc], [reward], [done],
+                           None if next_legal is None else [next_legal])
+
+    def extend(self, states, next_states, currents, next_locs, rewards, dones, next_legals=None):
+        # Appends a batch of transitions, returns the index of the last one
+        if self.read_only:
+            raise IOError("Replay store {0} was opened read only".format(self.directory))
+        if next_legals is None:
+            next_legals = np.broadcast_to(ALL_LEGAL, (len(rewards),) + ALL_LEGAL.shape)
+        columns = dict(zip([name for name, _, _ in self.fields],
+                           (states, next_states, currents, next_locs, rewards, dones, next_legals)))
+        count = len(rewards)
+        written = 0
+        while written < count:
+            segment, offset = divmod(self.size, self.segment_size)
+            if segment == len(self.segments):
+                self.segments.append(self.open_segment(segment))
+                self.flush()
+            rows = min(count - written, self.segment_size - offset)
+            for name, column in columns.items():
+                self.segments[segment][name][offset:offset + rows] = column[written:written + rows]
+            written += rows
+            self.size += rows
+        return self.size - 1
+
+    def view(self, start, stop):
+        # Zero-copy slices of rows start:stop, which must sit in one segment
+        segment, offset = divmod(start, self.segment_size)
+        if stop > self.size or stop - start > self.segment_size - offset:
+            raise IndexError("Rows {0}:{1} are not inside one filled segment".format(start, stop))
+        return {name: arrays[offset:offset + stop - start] for name, arrays in self.segments[segment].items()}
+
+    def sample(self, batch_size):
+        # Sorted indices so each segment is read front to back once
+        indices = np.sort(np.random.randint(0, self.size, batch_size))
+        batch = [np.empty((batch_size,) + shape, dtype=dtype) for _, dtype, shape in self.fields]
+        segments = indices // self.segment_size
+        for segment in np.unique(segments):
+            rows = segments == segment
+            offsets = indices[rows] - segment * self.segment_size
+            for column, (name, _, _) in enumerate(self.fields):
+                batch[column][rows] = self.segments[segment][name][offsets]
+        return tuple(batch) + (indices, np.ones(batch_size, dtype=np.float32))
+
+    def flush(self):
+        if self.read_only:
+            return
+        for arrays in self.segments:
+            for array in arrays.values():
+                array.flush()
+        with open(self.metadata_path, "w") as metadata_file:
+            json.dump({"segment_size": self.segment_size, "size": self.size,
+                       "state_shape": list(self.state_shape)}, metadata_file)
+
+    def close(self):
+        self.flush()
+        self.segments = []
@@ -0,0 +1,175 @@
+import multiprocessing as mp
+import os
+import queue
+import random
+import numpy as np
+
+from compact_game import CompactGame
+from numpy_policy import NumpyPolicy
+from replay import pack_legal
+
+
+def random_action(env, legal):
+    # A uniformly random move, among the legal ones when there is a mask
+    if legal is not None:
+        actions = np.flatnonzero(legal)
+        if len(actions) > 0:
+            return divmod(int(actions[random.randrange(0, len(actions))]), env.action_space)
+    return random.randrange(0, env.action_space), random.randrange(0, env.action_space)
+
+
+def rollout_worker(worker_id, activations, weights_queue, transitions, stop, max_steps, seed, legal_moves=False):
+    """
+    Plays games forever with the latest policy it was sent and puts every
+    finished episode on the transitions queue as stacked arrays. The policy
+    runs in NumPy so workers never import TensorFlow. legal_moves restricts
+    exploring and acting to the legal moves.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    env = CompactGame(seed=seed)
+    policy = None
+    exploration_rate = 1.0
+
+    while not stop.is_set():
+        # Only the newest weights matter, older ones are skipped
+        latest = None
+        try:
+            while True:
+                latest = weights_queue.get_nowait()
+        except queue.Empty:
+            pass
+        if latest is not None:
+            weights, exploration_rate = latest
+            policy = NumpyPolicy(weights, activations)
+
+        state = env.reset()
+        done = False
+        states, next_states, currents, next_locs, rewards, dones, next_legals = [], [], [], [], [], [], []
+        while not done and env.count < max_steps:
+            # With legal_moves, explore and act among the legal moves only,
+            # as DeepQNetwork(legal_moves=True) does
+            legal = env.legal_actions() if legal_moves else None
+            if policy is None or random.random() < exploration_rate:
+                current, next_loc = random_action(env, legal)
+            else:
+                action = policy.act(state, legal=legal)
+                current = action['current_location']
+                next_loc = action['next_location']
+            next_state, reward, done, _ = env.step({'current_location': current, 'next_location': next_loc})
+
+            states.append(state)
+            next_states.append(next_state)
+            currents.append(current)
+            next_locs.append(next_loc)
+            rewards.append(reward)
+            dones.append(done)
+            if legal_moves:
+                # Cached for the next step's legal_actions call
+                next_legals.append(pack_legal(env.legal_actions()))
+            state = next_state
+
+        transitions.put((
+            worker_id,
+            np.array(states),
+            np.array(next_states),
+            np.array(currents, dtype=np.int16),
+            np.array(next_locs, dtype=np.int16),
+            np.array(rewards, dtype=np.float32),
+            np.array(dones, dtype=bool),
+            np.array(next_legals, dtype=np.uint8) if legal_moves else None,
+        ))
+
+
+class RolloutPool(object):
+    """
+    Runs CompactGame rollouts in worker processes for a DeepQNetwork learner.
+
+    Workers hold a NumPy copy of the learner's model and get fresh weights
+    every sync_interval episodes; the learner only stores the transitions they
+    send back and runs memory_replay.
+    """
+
+    def __init__(self, agent, workers=None, max_steps=300, sync_interval=10, seed=None, legal_moves=None):
+        self.agent = agent
+        # Workers pick moves the way the learner does unless told otherwise
+        self.legal_moves = agent.legal_moves if legal_moves is None else legal_moves
+        self.workers = workers or os.cpu_count()
+        self.max_steps = max_steps
+        self.sync_interval = sync_interval
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        # The learner has TensorFlow loaded, which is not fork safe
+        self.context = mp.get_context("spawn")
+        self.transitions = self.context.Queue(maxsize=4 * self.workers)
+        self.stop_event = self.context.Event()
+        self.weights_queues = []
+        self.processes = []
+        self.episodes = 0
+
+    def start(self):
+        activations = self.agent.export_numpy_policy().activations
+        for worker_id in range(self.workers):
+            weights_queue = self.context.Queue()
+            process = self.context.Process(
+                target=rollout_worker,
+                args=(worker_id, activations, weights_queue, self.transitions,
+                      self.stop_event, self.max_steps, self.seed + worker_id, self.legal_moves),
+                daemon=True,
+            )
+            process.start()
+            self.weights_queues.append(weights_queue)
+            self.processes.append(process)
+        self.sync_weights()
+
+    def sync_weights(self):
+        weights = self.agent.model.get_weights()
+        for weights_queue in self.weights_queues:
+            weights_queue.put((weights, self.agent.exploration_rate))
+
+    def collect(self):
+        # Blocks until the next finished episode and stores it in the agent
+        _, states, next_states, currents, next_locs, rewards, dones, next_legals = self.transitions.get()
+        for index in range(len(rewards)):
+            action = {'current_location': currents[index], 'next_location': next_locs[index]}
+            self.agent.remember(states[index], next_states[index], action, rewards[index], dones[index],
+                                None if next_legals is None else next_legals[index])
+        self.episodes += 1
+        if self.episodes % self.sync_interval == 0:
+            self.sync_weights()
+        return rewards, dones
+
+    def stop(self):
+        self.stop_event.set()
+        # Drain the queue so workers blocked on put can exit
+        for process in self.processes:
+            while process.is_alive():
+                try:
+                    self.transitions.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            process.join()
+        self.processes = []
+        self.weights_queues = []
+
+
+def train(agent, iterations, workers=None, max_steps=300, sync_interval=10, legal_moves=None):
+    # Parallel version of the loop in main.py, the learner only replays
+    pool = RolloutPool(agent, workers, max_steps, sync_interval, legal_moves=legal_moves)
+    pool.start()
+    try:
+        for iteration in range(iterations):
+            rewards, dones = pool.collect()
+            agent.total_reward = float(rewards.sum())
+            agent.invalid_count = int((rewards == -1).sum())
+            agent.memory_replay()
+            agent.games_won.append(1 if dones[-1] else 0)
+            agent.finalize(iteration)
+    finally:
+        pool.stop()
+        agent.close()
+
+
+if __name__ == "__main__":
+    from agents import DeepQNetwork
+
+    train(DeepQNetwork(CompactGame(), legal_moves=True), 20000)
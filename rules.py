@@ -0,0 +1,90 @@
+import sys
+
+# Points of the classic (Windows) scoring, Game.actual_scoring
+STANDARD_SCORING = {
+    "discard_pile": 5, # deck to pile
+    "discard_foundation": 10, # deck to foundation
+    "pile_foundation": 10, # pile to foundation
+    "flip": 5, # pile flip
+    "foundation_pile": -15, # foundation to pile
+    "deck_reset": -10, # deck flip over Done
+    "deck_draw": 0, # draw from deck Done
+    "pile_pile": 0, # Pile to pile
+}
+
+# Vegas: 52 paid up front, 5 back for every card on a foundation
+VEGAS_SCORING = {
+    "discard_pile": 0,
+    "discard_foundation": 5,
+    "pile_foundation": 5,
+    "flip": 0,
+    "foundation_pile": -5,
+    "deck_reset": 0,
+    "deck_draw": 0,
+    "pile_pile": 0,
+}
+
+# Scoring entry of every engine move name
+SCORED_MOVES = {
+    "pile_pile": "pile_pile",
+    "deck_discard": "deck_draw",
+    "discard_pile": "discard_pile",
+    "discard_foundation": "discard_foundation",
+    "pile_foundation": "pile_foundation",
+    "discard_deck": "deck_reset",
+    "foundation_pile": "foundation_pile",
+}
+
+# Points, starting score and lowest score of every scoring
+SCORINGS = {
+    "standard": (STANDARD_SCORING, 0, 0),
+    "vegas": (VEGAS_SCORING, -52, -sys.maxsize),
+}
+
+
+class Rules(object):
+    """
+    Klondike variant played by Game and CompactGame.
+
+        draw: cards turned from the deck to the discard pile per move, 1 or 3
+        passes: times the deck may be gone through, None for no limit
+        scoring: "standard" (Game.actual_scoring) or "vegas"
+        max_steps: steps after which step reports info["truncated"], None
+            for no limit
+
+    Everything the engine needs per step is worked out here once, so step
+    reads tables instead of checking the mode: scores[move] and
+    flip_scores[uncovered] are the points of a move, draw the cards a draw
+    moves and redeals how often the discard pile may be turned over.
+    """
+
+    def __init__(self, draw=1, passes=None, scoring="standard", max_steps=None):
+        if draw not in (1, 3):
+            raise ValueError("draw must be 1 or 3, not {0!r}".format(draw))
+        if passes is not None and passes < 1:
+            raise ValueError("passes must be at least 1 or None, not {0!r}".format(passes))
+        if scoring not in SCORINGS:
+            raise ValueError("scoring must be one of {0}, not {1!r}".format(sorted(SCORINGS), scoring))
+        self.draw = draw
+        self.passes = passes
+        self.scoring = scoring
+        self.max_steps = max_steps
+
+        points, self.start_score, self.score_floor = SCORINGS[scoring]
+        self.scores = {move: points[name] for move, name in SCORED_MOVES.items()}
+        self.flip_scores = (0, points["flip"])
+        self.redeals = sys.maxsize if passes is None else passes - 1
+        self.step_limit = sys.maxsize if max_steps is None else max_steps
+
+    def __repr__(self):
+        return "Rules(draw={0}, passes={1}, scoring={2!r}, max_steps={3})".format(
+            self.draw, self.passes, self.scoring, self.max_steps)
+
+
+# Variants by name, for command line options
+MODES = {
+    "draw1": Rules(),
+    "draw3": Rules(draw=3),
+    "vegas1": Rules(draw=1, passes=1, scoring="vegas"),
+    "vegas3": Rules(draw=3, passes=3, scoring="vegas"),
+}
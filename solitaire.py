@@ -1,7 +1,15 @@
-from matplotlib.pyplot import plasma
-from card_elements import Pile, Suit, Card
+from card_elements import Pile, Suit, Card, EMPTY_CARD, CARD_VALUE, CARD_SUIT, CARD_COLOR, \
+    CAN_STACK, FOUNDATION_NEXT, IS_KING, IS_ACE
+from events import NullEventSink, NO_CARD
+from deals import shuffled_deal, decode_deal
+from rules import Rules, STANDARD_SCORING
 import numpy as np
+import copy
 import math
+import random
+
+# First location of every pile, the only locations a move can land on
+TARGET_LOCATIONS = [0, 13, 26, 39, 52, 65, 78, 91, 92, 93, 94, 95, 96]
 
 class Game:
     
@@ -48,27 +56,47 @@ class Game:
             "pile_pile": .1
         
         Episode Termination:
-            When the episode length is greater than 500
             When the game is won
+            info["truncated"] once rules.max_steps steps are taken
+
+        Variant:
+            rules (rules.py) sets draw 1 or 3, the deck pass limit, standard
+            or Vegas scoring and the step cap. score is the game's score
+            under that scoring, apart from the reward.
     """
     
-    actual_scoring = {
-        "discard_pile": 5, # deck to pile
-        "discard_foundation": 10, # deck to foundation
-        "pile_foundation": 10, # pile to foundation
-        "flip": 5, # pile flip
-        "foundation_pile": -15, # foundation to pile
-        "deck_reset": -10, # deck flip over Done
-        "deck_draw": 0, # draw from deck Done
-        "pile_pile": 0, # Pile to pile
-    }
+    actual_scoring = STANDARD_SCORING
     
-    def __init__(self):
+    def __init__(self, events=None, seed=None, rules=None):
         self.state = []
+        self.rules = rules if rules is not None else Rules()
+        self.score = self.rules.start_score
+        self.redeals_left = self.rules.redeals
+        self.uncovered = False
+        # Every game shuffles with its own generator, see reset
+        self.rng = random.Random(seed)
+        self.deal_order = bytes()
+        # Optional deal source with a next_deal method, e.g. curriculum.py
+        self.deals = None
         self.action_space = 97
-        self.observation_space = []
+        # Where moves are reported, see events.py
+        self.events = events if events is not None else NullEventSink()
+        # Cards in view for every location, and the same slots as a
+        # numeric (3, 97) array of value, suit and color
+        self.observation_space = np.full(97, EMPTY_CARD, dtype=object)
+        self.observation = np.zeros((3, 97), dtype=np.int8)
         self.count = 0
         
+        # Legal move mask, see legal_actions
+        self.target_locations = TARGET_LOCATIONS
+        self.source_locations = [range(pile * 13, pile * 13 + 13) for pile in range(0, 7)] + \
+            [range(location, location + 1) for location in range(91, 97)]
+        self.legal_mask = np.zeros((self.action_space, self.action_space), dtype=bool)
+        self.changed_piles = set()
+        # Move name of every (current pile, next pile) pair, as assign_action
+        self.moves = [[self.assign_action({'current_location': current, 'next_location': next_loc})
+                       for next_loc in range(13)] for current in range(13)]
+        
         self.values = ["1","2","3","4","5","6","7","8","9","10","11","12","13"]
     
         self.suits = [ #keys are unicode symbols for suits
@@ -82,20 +110,36 @@ class Game:
             "win": 5,
             "discard_pile": 1,
             "pile_foundation": 1,
+            "discard_foundation": 1,
             "foundation_pile": .5,
             "discard_deck": .5,
             "deck_discard": 1,
             "pile_pile": 1
         }
         
-    def reset(self):
-        # Initial state
+    def reset(self, seed=None):
+        # A seed restarts this game's generator and the deal source's, so
+        # the same seed always gives the same deal and following deals
+        if seed is not None:
+            self.rng.seed(seed)
+            if self.deals is not None:
+                self.deals.seed(seed)
+        if self.deals is not None:
+            self.deal(self.deals.next_deal())
+        else:
+            self.deal(shuffled_deal(self.rng))
+        return self.observation.copy()
+
+    def deal(self, order):
+        # order is the 52 byte deal from deals.py, order[0] is the top card
+        self.deal_order = bytes(order)
         self.state = []
-        self.observation_space = np.array([Card() for _ in range(0, 97)], dtype=Card)
         deck = Pile()
         self.count = 0
+        self.score = self.rules.start_score
+        self.redeals_left = self.rules.redeals
         deck.populate(self.values,self.suits)
-        deck.shuffle()
+        deck.cards = [deck.cards[card] for card in decode_deal(order)]
         for i in range(7):
             tempPile = Pile()
             [tempPile.insert_card(deck.remove_card()) for j in range(i+1)]
@@ -104,48 +148,39 @@ class Game:
         self.state.append(deck)
         for i in range(0,5):
             self.state.append(Pile())
+        self.changed_piles = set(range(0, len(self.state)))
         self.update_observation()
-        return np.asarray(self.observation_space)
+        self.events.record("reset", 0, 0)
             
-    def update_observation(self):
-        # for spot in self.observation_space:
-        it = np.nditer(self.observation_space, flags=['refs_ok', 'c_index'])
-        while not it.finished:
-            # Play Pile will go from 0 - 6
-            for pile in range(0, 7, 1):
-                # Observation space goes to 13 max cards
-                for card in range(0, 13, 1):
-                    if card < len(self.state[pile].cards) and self.state[pile].cards[card] is not None and self.state[pile].cards[card].flipped:
-                        self.observation_space[it.index] = self.state[pile].cards[card]
+    def update_observation(self, piles=None):
+        # Only the slots of the given piles are rewritten (all piles by
+        # default), empty slots share the EMPTY_CARD sentinel
+        if piles is None:
+            piles = range(0, len(self.state))
+        for pile in piles:
+            cards = self.state[pile].cards
+            if pile < 7:
+                # Play piles use 13 slots each, face up cards from the top
+                start = pile * 13
+                for card in range(0, 13):
+                    if card < len(cards) and cards[card] is not None and cards[card].flipped:
+                        self.observation_space[start + card] = cards[card]
                     else:
-                        self.observation_space[it.index] = Card()
-                    it.iternext()                        
-            # Deck
-            if len(self.state[7].cards) > 0:
-                self.observation_space[it.index] = self.state[7].cards[0]
+                        self.observation_space[start + card] = EMPTY_CARD
+                stop = start + 13
             else:
-                self.observation_space[it.index] = Card()
-            it.iternext()
-            # Discard
-            if len(self.state[8].cards) > 0:
-                self.observation_space[it.index] = self.state[8].cards[0]
-            else:
-                self.observation_space[it.index] = Card()
-            it.iternext()
-            # Foundations 
-            for pile in range(9, 13, 1):
-                if len(self.state[pile].cards) > 0:
-                    self.observation_space[it.index] = self.state[pile].cards[0]
-                else:
-                    self.observation_space[it.index] = Card()
-                it.iternext()
+                # Deck, discard and foundations show their top card
+                start = 84 + pile
+                self.observation_space[start] = cards[0] if len(cards) > 0 else EMPTY_CARD
+                stop = start + 1
+            self.observation[:, start:stop] = np.transpose([card.get_observation() for card in self.observation_space[start:stop]])
 
     def step(self, action):        
         if self.check_if_completed():
-            print("You won!")
+            self.events.record("win", 0, 0)
             reward = 1
             done = True
-            return np.array(self.observation_space), reward, done, {}
+            return self.observation.copy(), reward, done, {"truncated": False}
         else:
             done = False
             
@@ -155,13 +190,16 @@ class Game:
 
         if not self.valid_action(action, move):
             # If NN stops learning, end game instead of returning -1   
-            return np.array(self.observation_space), -1, done, {}
+            return self.observation.copy(), -1, done, {"truncated": self.count >= self.rules.step_limit}
         
         reward = self.move_cards(action, move)
+        rules = self.rules
+        self.score = max(rules.score_floor, self.score + rules.scores[move] + rules.flip_scores[self.uncovered])
+        self.changed_piles.update((action['current_location'], action['next_location']))
         
-        self.update_observation()        
+        self.update_observation((action['current_location'], action['next_location']))
         
-        return np.asarray(self.observation_space), reward, done, {}
+        return self.observation.copy(), reward, done, {"truncated": self.count >= rules.step_limit}
     
     def translate_action(self, action):
         current = self.number_to_location(action['current_location'])
@@ -191,18 +229,33 @@ class Game:
             return 12
             
     def cards_to_move(self, current, location):
-        playable_cards = self.get_playable_count(current)
-        if playable_cards == 0:
-            return 0
+        # A play pile location picks the card that many slots below the
+        # top, so it moves that card and the ones above it. Deck, discard
+        # and foundation locations move their top card.
         if location > 90:
-            return playable_cards
-        count = 0
-        for val in range(location, (current+1)*13):
-            if self.observation_space[val] is not None and \
-                not self.observation_space[val]:
-                count+=1
-        return count
+            return 1
+        return location % 13 + 1
     
+    def snapshot(self):
+        # Full copy of the piles, CompactGame has a much cheaper one
+        return copy.deepcopy((self.state, self.count, self.score, self.redeals_left))
+
+    def restore(self, snapshot):
+        self.state, self.count, self.score, self.redeals_left = copy.deepcopy(snapshot)
+        self.changed_piles = set(range(0, len(self.state)))
+        self.update_observation()
+
+    def clone(self):
+        # Independent copy that reports no events
+        game = copy.copy(self)
+        game.events = NullEventSink()
+        game.rng = copy.deepcopy(self.rng)
+        game.observation_space = self.observation_space.copy()
+        game.observation = self.observation.copy()
+        game.legal_mask = self.legal_mask.copy()
+        game.restore(self.snapshot())
+        return game
+        
     def get_game_elements(self):
         return_object = {
             "deck": str(self.state[7]),
@@ -230,12 +283,12 @@ class Game:
         if action['number'] > len(self.state[action['current_location']].cards):
             return False
         
-        # Invalid discard, deck rules
-        if action['next_location'] == 7:
-            if len(self.state[action['next_location']].cards) != 0 or action['current_location'] != 8:
-                return False
-            if len(self.state[action['current_location']].cards) == 0:
-                return False
+        # Deck and discard rules: draw while the deck has cards, turn the
+        # discard pile over once it is empty and passes are left
+        if move == "deck_discard":
+            return True
+        if move == "discard_deck":
+            return len(self.state[action['next_location']].cards) == 0 and self.redeals_left > 0
         
         # Cannot flip flipped up cards
         if action['current_location'] == action['next_location'] and \
@@ -263,7 +316,7 @@ class Game:
                 return False
             # Cannot move incorrect colors/numbers to foundation
             bottom_card = self.state[action['current_location']].cards[0]
-            return self.foundations_rule(action['next_location'],bottom_card)
+            return self.foundations_rule(action['next_location'], bottom_card)
         else:
             # Non-foundation moves
             
@@ -279,12 +332,8 @@ class Game:
             if not self.flipped_up_cards(top_card):
                 return False
             
-            # Cannot stack on same colors
-            if not self.stacking_color_rule(bottom_card, top_card):
-                return False
-            
-            # Cannot stack out of order
-            if not self.stacking_number_rule(bottom_card, top_card):
+            # Alternate colors in descending order
+            if not CAN_STACK[bottom_card.id, top_card.id]:
                 return False
                 
         return True
@@ -312,73 +361,77 @@ class Game:
         return act
         
     def move_cards(self, action, move):
+        self.uncovered = False
         if move == "pile_pile":
             temp = []
             for card in range(0, action['number']):
                 temp.append(self.state[action['current_location']].remove_card())
             for card in range(action['number'] - 1, -1, -1):
                 self.state[action['next_location']].insert_card(temp[card])
-                print("Moving card", str(temp[card].suit), temp[card].value," from ", action['current_location'], " to ", action['next_location'])
+            self.events.record(move, action['current_location'], action['next_location'], temp[-1].get_id() if temp else NO_CARD)
             if len(self.state[action['current_location']].cards) > 0 and not self.state[action['current_location']].cards[0].flipped:
                 self.state[action['current_location']].cards[0].flip()
+                self.uncovered = True
                 card = self.state[action['current_location']].cards[0]
-                print("Flipping card", card.suit, card.value)
+                self.events.record("flip", action['current_location'], action['current_location'], card.get_id())
         
         elif move == "flip":
             self.state[action['current_location']].cards[0].flip()
             card = self.state[action['current_location']].cards[0]
-            print("Flipping card", card.suit, card.value)
+            self.events.record("flip", action['current_location'], action['current_location'], card.get_id())
             
         elif move == "deck_discard":
-            temp = self.state[action['current_location']].draw_top_card()
-            self.state[action['next_location']].insert_card(temp)
-            print("Moving card", temp.suit, temp.value, " from Deck to ", action['next_location'])
+            # rules.draw cards one by one, the last drawn ends on top
+            for _ in range(min(self.rules.draw, len(self.state[action['current_location']].cards))):
+                temp = self.state[action['current_location']].draw_top_card()
+                self.state[action['next_location']].insert_card(temp)
+                self.events.record(move, action['current_location'], action['next_location'], temp.get_id())
 
         elif move == "discard_deck":
-            self.state[action['next_location']].cards = self.state[action['current_location']].cards[::-1].flip()
-            self.state[action['current_location']] = []
-            print("Moving cards from Discard to Deck")
+            # Turn the discard pile over, face down
+            cards = self.state[action['current_location']].cards[::-1]
+            for card in cards:
+                card.flip()
+            self.state[action['next_location']].cards = cards
+            self.state[action['current_location']].cards = []
+            self.redeals_left -= 1
+            self.events.record(move, action['current_location'], action['next_location'])
 
         else:
             temp = self.state[action['current_location']].remove_card()
             self.state[action['next_location']].insert_card(temp)
-            print("Moving card", temp.suit, temp.value," from ", action['current_location'], " to ", action['next_location'])
+            self.events.record(move, action['current_location'], action['next_location'], temp.get_id())
             if len(self.state[action['current_location']].cards) > 0 and not self.state[action['current_location']].cards[0].flipped:
                     self.state[action['current_location']].cards[0].flip()
+                    self.uncovered = True
                     card = self.state[action['current_location']].cards[0]
-                    print("Flipping card", card.suit, card.value)
+                    self.events.record("flip", action['current_location'], action['current_location'], card.get_id())
         return self.reward[move]
         
-    # Rules
+    # Rules, lookups in the card id tables of card_elements
     def stacking_color_rule(self, new_card, current_card):
-        return current_card.suit.color != new_card.suit.color
+        return CARD_COLOR[current_card.id] != CARD_COLOR[new_card.id]
         
     def flipped_up_cards(self, card):
         return card.flipped
             
     def stacking_number_rule(self, new_cards, current_card):
-        next_index = self.values.index(new_cards.value)+1
-        return current_card.value != "K" and next_index < 13 and current_card.value == self.values[next_index]
+        return CARD_VALUE[current_card.id] == CARD_VALUE[new_cards.id] + 1
     
     def same_suit(self, new_card, current_card):
-        return new_card.suit.suit_name == current_card.suit.suit_name
+        return CARD_SUIT[new_card.id] == CARD_SUIT[current_card.id]
         
     def foundations_rule(self, location, new_card):
-        if len(self.state[location].cards) == 0 and new_card.value != "A":
-            return False
-        if len(self.state[location].cards) == 0 and new_card.value == "A":
-            return True            
-        current_card = self.state[location].cards[0]
-        return self.stacking_number_rule(current_card, new_card) \
-            and self.same_suit(new_card, current_card)
+        if len(self.state[location].cards) == 0:
+            return IS_ACE[new_card.id]
+        return FOUNDATION_NEXT[new_card.id, self.state[location].cards[0].id]
     
     def empty_piles_rule(self, new_card):
-        return new_card.value == "K"
+        return IS_KING[new_card.id]
         
     def check_card_order(self, higherCard, lowerCard):
-        suits_different = self.suits[higherCard.suit] != self.suits[lowerCard.suit]
-        value_consecutive = self.values[self.values.index(higherCard.value)-1] == lowerCard.value
-        return suits_different and value_consecutive
+        return CARD_SUIT[higherCard.id] != CARD_SUIT[lowerCard.id] and \
+            CARD_VALUE[higherCard.id] == CARD_VALUE[lowerCard.id] + 1
     
     def check_if_completed(self):
         self.count+=1
@@ -390,71 +443,61 @@ class Game:
     def can_move_to_foundation(self, card):
         if card is None:
             return False
-        elif len(self.state.foundations[card.suit].cards)>0:
-            highest_value = self.state.foundations[card.suit].cards[0].value
-            if self.values[self.values.index(highest_value)+1] == card.value:
-                return True
-            else:
-                return False   
-        else: 
-            if card.value=="A":
-                return True
-            else:
-                return False     
+        return any(self.foundations_rule(location, card) for location in range(9, 13))
                 
+    def pile_size(self, pile):
+        return len(self.state[pile].cards)
+
     def get_playable_count(self, location):
-        if location < 6 \
-            and len(self.state[location].cards) > 0:
-            return 1
+        # Face up cards, always an unbroken run from the top
         return len(self.state[location].get_flipped_cards())
             
-    def deterministic_actions(self):
-        flipped_up_cards = []
-        empty_pile = []
-        
-        # Get all cards that are face up or need to be flipped
-        for i in range(len(self.play_piles)):
-            pile = self.play_piles[i]
-            # Check if pile has cards
-            if len(pile.cards) == 0:
-                empty_pile.append(i)
+    def legal_actions(self):
+        # Boolean (97, 97) mask of the location pairs step would accept.
+        # Every location of a pile maps to the same destination, so only
+        # the first location of each pile (target_locations) is marked.
+        # Rows and columns are only rebuilt for piles changed since the
+        # last call.
+        for pile in self.changed_piles:
+            self.update_legal_pile(pile)
+        self.changed_piles.clear()
+        return self.legal_mask
+
+    def update_legal_pile(self, pile):
+        # A move only depends on the piles it leaves and lands on, and only
+        # locations that hold a playable card can start one
+        mask = self.legal_mask
+        locations = self.source_locations[pile]
+        mask[locations.start:locations.stop, :] = False
+        for location, number in self.playable_locations(pile):
+            for next_pile in range(len(self.target_locations)):
+                move = self.moves[pile][next_pile]
+                mask[location, self.target_locations[next_pile]] = \
+                    move in self.reward and self.can_move(pile, next_pile, number, move)
+        next_loc = self.target_locations[pile]
+        mask[:, next_loc] = False
+        for current in range(len(self.target_locations)):
+            move = self.moves[current][pile]
+            if move not in self.reward:
                 continue
-            if not pile.cards[0].flipped:
-                self.possible_moves.append({"move": "flip", "location": i, "to": i})
-            else:
-                flipped_up_cards.append({"location": "pile", "start": i, "card": pile.card[0]})    
-        
-        # Get all foundation top cards
-        for found in self.foundations:
-            flipped_up_cards.append({"location": "foundation", "start": found.cards[0].suit.suit_name, "card": found.cards[0]})
-                
-        # Deck check
-        if len(self.deck.cards) > 0:
-            self.possible_moves.append({"move":"deck_draw"})
-        else: 
-            self.possible_moves.append({"move":"deck_reset"})
-        
-        # Add top discard card to flipped_up cards 
-        if len(self.deck.discard) > 0:
-            flipped_up_cards.append({"location": "discard", "start": "discard", "card": self.deck.discard[0]})
-            
-        # For all flipped up cards check what moves are available
-        for card in flipped_up_cards:
-            # Check for Kings and empty piles
-            for pil in empty_pile:
-                if self.empty_piles_rule(card.card):
-                    self.possible_moves.append({"move": "pile_pile", "location": card.start, "to": pil})
-                
-            # Moveable to Foundation
-            if self.foundations_rule(card.card):
-                self.possible_moves.append({"move": card.location+"_foundation", "location": card.start, "to": self.foundations[card.suit.suit_name]})
-                
-            # Stacking cards
-            for card2 in flipped_up_cards:
-                if self.stacking_color_rule(card.card, card2.card) and \
-                    self.stacking_number_rule(card.card, card2.card) and \
-                    self.valid_move_rule(card.location+"_"+card2.location):
-                    self.possible_moves.append({"move": card.location+"_"+card2.location, "location": card.start, "to": card2.start})
-        
-        # Check again for any flipped up card to move multiple cards
-        
\ No newline at end of file
+            for location, number in self.playable_locations(current):
+                mask[location, next_loc] = self.can_move(current, pile, number, move)
+
+    def playable_locations(self, pile):
+        # (location, number of cards moved) for every location of the pile
+        # that can start a move: the face up run of a play pile, otherwise
+        # the top card
+        if pile < 7:
+            start = pile * 13
+            return [(start + slot, slot + 1) for slot in range(min(self.get_playable_count(pile), 13))]
+        if self.pile_size(pile):
+            return [(self.target_locations[pile], 1)]
+        return []
+
+    def can_move(self, current, next_loc, number, move):
+        # valid_action for piles rather than locations
+        return self.valid_action({'current_location': current, 'next_location': next_loc, 'number': number}, move)
+
+    def is_legal(self, current, next_loc):
+        action = self.translate_action({'current_location': current, 'next_location': next_loc})
+        return self.valid_action(action, self.assign_action(action))
@@ -0,0 +1,290 @@
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+
+from card_elements import CARD_COUNT, CARD_VALUE, CARD_SUIT, CARD_COLOR
+from compact_game import CompactGame, PILE_STRIDE, DECK, DISCARD, FOUNDATIONS, FACE_UP, CARD_MASK
+
+SOLVABLE = "solvable"
+UNSOLVABLE = "unsolvable"
+UNKNOWN = "unknown"
+
+# Search order of the move types, lower first. Moves from the deck and
+# discard piles are searched as stock moves, after all of these
+MOVE_ORDER = {
+    "pile_foundation": 0,
+    "discard_foundation": 0,
+    "pile_pile": 3,
+    "foundation_pile": 6,
+}
+
+
+class Solver(object):
+    """
+    Depth first search for a winning line of a deal under the CompactGame
+    rules, playing moves on one CompactGame and taking them back with undo.
+
+    Every position reached is stored by a canonical key in which the play
+    piles and the foundations are sorted, as their order does not change
+    what can be won, and the stock is kept in drawing order without the
+    split between deck and discard, so a position is expanded once however
+    it is reached and cycling the deck is never searched. Cards that can never be needed on the
+    play piles again are moved to the foundations straight away without
+    branching. Moves are tried foundation moves first, then moves that
+    turn a card over or empty a pile, then the rest.
+
+    solve returns SOLVABLE with the winning line of actions, UNSOLVABLE
+    once every position has been tried, or UNKNOWN when node_limit
+    positions or time_limit seconds are used up.
+    """
+
+    def __init__(self, node_limit=100000, time_limit=None):
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.game = CompactGame()
+        self.nodes = 0
+        # Piles whose top card may go straight to a foundation
+        self.auto_piles = list(range(7))
+        if "discard_foundation" in self.game.reward:
+            self.auto_piles.append(DISCARD)
+
+    def solve(self, deal):
+        game = self.game
+        game.deal(deal)
+        started = time.perf_counter()
+        self.nodes = 0
+        seen = set()
+
+        line = []
+        steps = self.auto_moves(line)
+        if self.won():
+            return SOLVABLE, line
+        seen.add(self.canonical_key())
+        # One frame per position on the current line: its moves, the next
+        # one to try and how many steps (the move and its auto moves) led
+        # to it
+        stack = [[self.ordered_moves(), 0, steps]]
+        while stack:
+            frame = stack[-1]
+            moves, index, _ = frame
+            if index == len(moves):
+                stack.pop()
+                for _ in range(frame[2]):
+                    game.undo()
+                    line.pop()
+                continue
+            frame[1] = index + 1
+
+            self.nodes += 1
+            if self.nodes > self.node_limit or \
+                    (self.time_limit is not None and self.nodes % 256 == 0 and time.perf_counter() - started > self.time_limit):
+                return UNKNOWN, None
+
+            steps = self.play_move(moves[index], line)
+            steps += self.auto_moves(line)
+            if self.won():
+                return SOLVABLE, line
+            key = self.canonical_key()
+            if key in seen:
+                for _ in range(steps):
+                    game.undo()
+                    line.pop()
+                continue
+            seen.add(key)
+            stack.append([self.ordered_moves(), 0, steps])
+        return UNSOLVABLE, None
+
+    def play_move(self, move, line):
+        # A move is an action, or (position, action) for a stock move: the
+        # stock is cycled until its card at position in drawing order is
+        # on the discard pile, then action plays it. Returns the steps made.
+        if not isinstance(move, tuple):
+            self.play(move, line)
+            return 1
+        position, action = move
+        board = self.game.board
+        draw = self.game.target_locations[DECK] * self.game.action_space + self.game.target_locations[DISCARD]
+        redeal = self.game.target_locations[DISCARD] * self.game.action_space + self.game.target_locations[DECK]
+        steps = 0
+        # A card already on top of the discard pile is played directly,
+        # one further down needs the stock cycled round to it
+        if position < board[DISCARD * PILE_STRIDE] - 1:
+            while board[DECK * PILE_STRIDE]:
+                self.play(draw, line)
+                steps += 1
+            self.play(redeal, line)
+            steps += 1
+        while board[DISCARD * PILE_STRIDE] <= position:
+            self.play(draw, line)
+            steps += 1
+        self.play(action, line)
+        return steps + 1
+
+    def play(self, action, line):
+        current, next_loc = divmod(action, self.game.action_space)
+        self.game.step({'current_location': current, 'next_location': next_loc})
+        line.append(action)
+
+    def won(self):
+        board = self.game.board
+        return sum(board[pile * PILE_STRIDE] for pile in FOUNDATIONS) == CARD_COUNT
+
+    def canonical_key(self):
+        board = self.game.board
+        piles = [bytes(board[pile * PILE_STRIDE:pile * PILE_STRIDE + 1 + board[pile * PILE_STRIDE]])
+                 for pile in range(7)]
+        # The stock in drawing order, discard bottom up then deck top down.
+        # Cycling the stock reaches every split of that order between deck
+        # and discard, so the split is left out.
+        deck = board[DECK * PILE_STRIDE + 1:DECK * PILE_STRIDE + 1 + board[DECK * PILE_STRIDE]]
+        discard = board[DISCARD * PILE_STRIDE + 1:DISCARD * PILE_STRIDE + 1 + board[DISCARD * PILE_STRIDE]]
+        stock = bytes(card & CARD_MASK for card in discard) + bytes(reversed(deck))
+        foundations = [board[pile * PILE_STRIDE] and board[pile * PILE_STRIDE + board[pile * PILE_STRIDE]] for pile in FOUNDATIONS]
+        return b"".join(sorted(piles)) + b"|" + stock + b"|" + bytes(sorted(foundations))
+
+    def foundation_values(self):
+        # Highest value on the foundation of every suit, 0 if none
+        board = self.game.board
+        values = [0, 0, 0, 0]
+        for pile in FOUNDATIONS:
+            size = board[pile * PILE_STRIDE]
+            if size:
+                card = board[pile * PILE_STRIDE + size] & CARD_MASK
+                values[CARD_SUIT[card]] = CARD_VALUE[card]
+        return values
+
+    def auto_moves(self, line):
+        # Plays safe foundation moves until there are none, a card is safe
+        # when no card that could go on it is still needed in play: both
+        # opposite color foundations hold value - 1 and the other suit of
+        # its color value - 2. Returns the number of moves played.
+        game = self.game
+        board = game.board
+        played = 0
+        moved = True
+        while moved:
+            moved = False
+            values = self.foundation_values()
+            for pile in self.auto_piles:
+                size = board[pile * PILE_STRIDE]
+                if size == 0:
+                    continue
+                card = board[pile * PILE_STRIDE + size]
+                if not card & FACE_UP:
+                    continue
+                card &= CARD_MASK
+                value = CARD_VALUE[card]
+                if value != values[CARD_SUIT[card]] + 1:
+                    continue
+                opposite = [values[suit] for suit in range(4) if CARD_COLOR[suit * 13] != CARD_COLOR[card]]
+                same = [values[suit] for suit in range(4) if suit != CARD_SUIT[card] and CARD_COLOR[suit * 13] == CARD_COLOR[card]]
+                if value > 2 and (min(opposite) < value - 1 or same[0] < value - 2):
+                    continue
+                target = self.foundation_for(CARD_SUIT[card])
+                self.play(game.source_locations[pile][0] * game.action_space + game.target_locations[target], line)
+                played += 1
+                moved = True
+                break
+        return played
+
+    def foundation_for(self, suit):
+        # The foundation holding suit, or the first empty one
+        board = self.game.board
+        empty = None
+        for pile in FOUNDATIONS:
+            size = board[pile * PILE_STRIDE]
+            if size and CARD_SUIT[board[pile * PILE_STRIDE + size] & CARD_MASK] == suit:
+                return pile
+            if not size and empty is None:
+                empty = pile
+        return empty
+
+    def ordered_moves(self):
+        game = self.game
+        board = game.board
+        moves = []
+        for action in np.flatnonzero(game.legal_actions()):
+            current, next_loc = divmod(int(action), game.action_space)
+            source = game.number_to_location(current)
+            target = game.number_to_location(next_loc)
+            if source in (DECK, DISCARD):
+                # Replaced by the stock moves below
+                continue
+            move = game.moves[source][target]
+            order = MOVE_ORDER[move]
+            if move == "pile_pile":
+                size = board[source * PILE_STRIDE]
+                number = current % 13 + 1
+                if number == size:
+                    # A whole pile onto an empty pile changes nothing
+                    if board[target * PILE_STRIDE] == 0:
+                        continue
+                    order = 1
+                elif not board[source * PILE_STRIDE + size - number] & FACE_UP:
+                    order = 1
+            moves.append((order, action))
+        moves.sort()
+        return [action for _, action in moves] + self.stock_moves()
+
+    def stock_moves(self):
+        # Every stock card that could be played once cycled onto the
+        # discard pile, with where it goes
+        game = self.game
+        board = game.board
+        deck = board[DECK * PILE_STRIDE + 1:DECK * PILE_STRIDE + 1 + board[DECK * PILE_STRIDE]]
+        discard = board[DISCARD * PILE_STRIDE + 1:DISCARD * PILE_STRIDE + 1 + board[DISCARD * PILE_STRIDE]]
+        stock = [card & CARD_MASK for card in discard] + [card & CARD_MASK for card in reversed(deck)]
+        source = game.target_locations[DISCARD] * game.action_space
+
+        values = self.foundation_values()
+        empty = None
+        tops = []
+        for pile in range(7):
+            size = board[pile * PILE_STRIDE]
+            if size == 0:
+                if empty is None:
+                    empty = pile
+            elif board[pile * PILE_STRIDE + size] & FACE_UP:
+                tops.append((pile, board[pile * PILE_STRIDE + size] & CARD_MASK))
+
+        foundation_moves, pile_moves = [], []
+        for position, card in enumerate(stock):
+            value = CARD_VALUE[card]
+            if "discard_foundation" in game.reward and value == values[CARD_SUIT[card]] + 1:
+                target = self.foundation_for(CARD_SUIT[card])
+                foundation_moves.append((position, source + game.target_locations[target]))
+            if value == 13:
+                if empty is not None:
+                    pile_moves.append((position, source + game.target_locations[empty]))
+                continue
+            for pile, top in tops:
+                if CARD_VALUE[top] == value + 1 and CARD_COLOR[top] != CARD_COLOR[card]:
+                    pile_moves.append((position, source + game.target_locations[pile]))
+        return foundation_moves + pile_moves
+
+
+def solve_deal(deal, node_limit=100000, time_limit=None):
+    # Result and line for one deal, for process pools
+    solver = Solver(node_limit, time_limit)
+    result, line = solver.solve(bytes(deal))
+    return result, line, solver.nodes
+
+
+def classify_deals(deals, node_limit=100000, time_limit=None, workers=None):
+    """
+    Classifies many deals across a process pool, returns one
+    (result, line, nodes) per deal in order.
+    """
+    deals = [bytes(deal) for deal in deals]
+    with mp.Pool(workers or os.cpu_count()) as pool:
+        return pool.starmap(solve_deal, [(deal, node_limit, time_limit) for deal in deals], chunksize=4)
+
+
+if __name__ == "__main__":
+    from deals import benchmark_deals
+
+    started = time.perf_counter()
+    results = classify_deals(benchmark_deals(), node_limit=100000, time_limit=10)
+    counts = {result: sum(1 for found, _, _ in results if found == result) for result in (SOLVABLE, UNSOLVABLE, UNKNOWN)}
+    print(counts, "in {0:.1f}s".format(time.perf_counter() - started))
@@ -0,0 +1,174 @@
+import json
+import struct
+import zlib
+import numpy as np
+
+from card_elements import CARD_COUNT
+
+MAGIC = b"SOLTRAJ1"
+
+# Columns of a chunk, (name, dtype, shape of one row). Episode columns have
+# a row per episode, step columns a row per step and observations a row per
+# step plus the final observation of every episode.
+EPISODE_COLUMNS = [
+    ("deals", np.uint8, (CARD_COUNT,)),
+    ("lengths", np.uint32, ()),
+]
+STEP_COLUMNS = [
+    ("currents", np.uint8, ()),
+    ("next_locs", np.uint8, ()),
+    ("rewards", np.float32, ()),
+    ("dones", bool, ()),
+]
+OBSERVATION_COLUMNS = [
+    ("observations", np.int8, (3, 97)),
+]
+
+
+class TrajectoryWriter(object):
+    """
+    Appends whole episodes to a trajectory file. Steps are buffered and
+    written as chunks of at least chunk_steps steps, each column of a
+    chunk zlib compressed on its own (columnar, so the int8 observations
+    compress well). A chunk only holds whole episodes, so every chunk can
+    be read on its own.
+
+        writer.begin_episode(env.deal_order, state)
+        writer.record(action, reward, done, next_state)   # every step
+        writer.end_episode()
+
+    File layout: MAGIC, then per chunk a 4 byte little endian header
+    length, a JSON header with the row counts and compressed column sizes,
+    and the compressed columns in header order.
+    """
+
+    def __init__(self, path, chunk_steps=65536, level=1):
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.chunk_steps = chunk_steps
+        self.level = level
+        self.columns = {name: [] for name, _, _ in EPISODE_COLUMNS + STEP_COLUMNS + OBSERVATION_COLUMNS}
+        self.steps = 0
+        self.episode_steps = 0
+
+    def begin_episode(self, deal, observation):
+        self.columns["deals"].append(np.frombuffer(bytes(deal), dtype=np.uint8))
+        self.columns["observations"].append(observation)
+        self.episode_steps = 0
+
+    def record(self, action, reward, done, next_observation):
+        columns = self.columns
+        columns["currents"].append(action['current_location'])
+        columns["next_locs"].append(action['next_location'])
+        columns["rewards"].append(reward)
+        columns["dones"].append(done)
+        columns["observations"].append(next_observation)
+        self.episode_steps += 1
+
+    def end_episode(self):
+        self.columns["lengths"].append(self.episode_steps)
+        self.steps += self.episode_steps
+        if self.steps >= self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        if not self.columns["lengths"]:
+            return
+        header = {"episodes": len(self.columns["lengths"]), "steps": self.steps, "columns": []}
+        blocks = []
+        for name, dtype, shape in EPISODE_COLUMNS + STEP_COLUMNS + OBSERVATION_COLUMNS:
+            block = zlib.compress(np.asarray(self.columns[name], dtype=dtype).tobytes(), self.level)
+            header["columns"].append([name, len(block)])
+            blocks.append(block)
+        encoded = json.dumps(header).encode()
+        self.file.write(struct.pack("<I", len(encoded)) + encoded)
+        self.file.writelines(blocks)
+        self.file.flush()
+        self.columns = {name: [] for name in self.columns}
+        self.steps = 0
+
+    def close(self):
+        # An episode still open is dropped, it has no end
+        self.columns["deals"] = self.columns["deals"][:len(self.columns["lengths"])]
+        self.columns["observations"] = self.columns["observations"][:self.steps + len(self.columns["lengths"])]
+        for name, _, _ in STEP_COLUMNS:
+            self.columns[name] = self.columns[name][:self.steps]
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def read_chunks(path):
+    # Yields one dict of column arrays per chunk, reading a chunk at a time
+    dtypes = {name: (dtype, shape) for name, dtype, shape in EPISODE_COLUMNS + STEP_COLUMNS + OBSERVATION_COLUMNS}
+    with open(path, "rb") as trajectory_file:
+        if trajectory_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{0} is not a trajectory file".format(path))
+        while True:
+            size = trajectory_file.read(4)
+            if len(size) < 4:
+                return
+            header = json.loads(trajectory_file.read(struct.unpack("<I", size)[0]))
+            chunk = {}
+            for name, length in header["columns"]:
+                dtype, shape = dtypes[name]
+                chunk[name] = np.frombuffer(zlib.decompress(trajectory_file.read(length)), dtype=dtype).reshape((-1,) + shape)
+            yield chunk
+
+
+def chunk_transitions(chunk):
+    # Step columns plus states and next_states, the observation before and
+    # after every step. Observation rows run episode by episode, each with
+    # one more row than it has steps.
+    lengths = chunk["lengths"].astype(np.int64)
+    episode_of_step = np.repeat(np.arange(len(lengths)), lengths)
+    state_rows = np.arange(len(episode_of_step)) + episode_of_step
+    return {
+        "states": chunk["observations"][state_rows],
+        "next_states": chunk["observations"][state_rows + 1],
+        "currents": chunk["currents"],
+        "next_locs": chunk["next_locs"],
+        "rewards": chunk["rewards"],
+        "dones": chunk["dones"],
+    }
+
+
+def iterate_batches(paths, batch_size, drop_last=False):
+    """
+    Streams batches of batch_size transitions from one or more trajectory
+    files, as dicts of states, next_states, currents, next_locs, rewards
+    and dones (the fields of replay.transition_fields but next_legal, which
+    trajectories do not keep). Only one chunk is in memory at a time;
+    batches run on across chunk and file boundaries.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    pending = []
+    pending_size = 0
+    for path in paths:
+        for chunk in read_chunks(path):
+            transitions = chunk_transitions(chunk)
+            start = 0
+            steps = len(transitions["rewards"])
+            while start < steps:
+                take = min(batch_size - pending_size, steps - start)
+                pending.append({name: column[start:start + take] for name, column in transitions.items()})
+                pending_size += take
+                start += take
+                if pending_size == batch_size:
+                    yield join_batches(pending)
+                    pending, pending_size = [], 0
+    if pending and not drop_last:
+        yield join_batches(pending)
+
+
+def join_batches(parts):
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
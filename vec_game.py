@@ -0,0 +1,199 @@
+import numpy as np
+
+from card_elements import CARD_COUNT, CAN_STACK, FOUNDATION_NEXT, IS_KING, IS_ACE
+from compact_game import PILE_COUNT, PILE_CAPACITY, DECK, DISCARD, FACE_UP, CARD_MASK, OBSERVATION_TABLE
+from solitaire import Game
+
+# Moves Game.valid_action can accept, indexed by VecGame.move_type
+MOVES = ("pile_pile", "discard_pile", "pile_foundation", "discard_foundation", "foundation_pile", "discard_deck", "deck_discard")
+DISCARD_DECK = MOVES.index("discard_deck")
+DECK_DISCARD = MOVES.index("deck_discard")
+
+
+class VecGame:
+
+    """
+    Description:
+        A batch of games of solitaire stepped together with NumPy.
+
+        Every game uses the CompactGame layout and rules, stored in stacked
+        arrays so one call to step applies a whole batch of actions with
+        masked array operations instead of a Python loop per game.
+
+        Observation:
+            (num_games, 3, 97) int8 array, one CompactGame observation per
+            game.
+
+        Actions:
+            {'current_location': array, 'next_location': array}, one
+            location pair per game, encoded as in Game.
+
+        Reward:
+            Game.reward for valid moves, -1 for invalid moves, plus 1 on
+            the move that wins the game.
+
+        Episode Termination:
+            When the game is won
+            When max_steps moves have been played, if set
+            Finished games are dealt again straight away, so the returned
+            observation for a finished game is the start of its next game.
+            info["final_observations"] holds their last observations, in
+            game order.
+    """
+
+    def __init__(self, num_games, max_steps=None, seed=None):
+        self.num_games = num_games
+        self.max_steps = max_steps
+        self.action_space = 97
+        self.rng = np.random.default_rng(seed)
+        self.games = np.arange(num_games)
+
+        # Rule tables taken from Game so both engines agree on the encoding
+        rules = Game()
+        self.reward = rules.reward
+        self.location_pile = np.array([rules.number_to_location(location) for location in range(97)], dtype=np.intp)
+        self.move_type = np.full((PILE_COUNT, PILE_COUNT), -1, dtype=np.int8)
+        self.move_reward = np.zeros((PILE_COUNT, PILE_COUNT), dtype=np.float32)
+        for current in range(PILE_COUNT):
+            for next_loc in range(PILE_COUNT):
+                move = rules.assign_action({'current_location': current, 'next_location': next_loc})
+                if move in MOVES and move in rules.reward:
+                    self.move_type[current, next_loc] = MOVES.index(move)
+                    self.move_reward[current, next_loc] = rules.reward[move]
+
+        # Same layout as CompactGame.board: cards bottom first, FACE_UP set
+        # once turned over, sizes hold the card count of every pile
+        self.cards = np.zeros((num_games, PILE_COUNT, PILE_CAPACITY), dtype=np.uint8)
+        self.sizes = np.zeros((num_games, PILE_COUNT), dtype=np.int16)
+        self.count = np.zeros(num_games, dtype=np.int64)
+        self.slots = np.zeros((num_games, 97), dtype=np.intp)
+        self.observation = np.zeros((num_games, 3, 97), dtype=np.int8)
+
+    def reset(self):
+        self.deal(self.games)
+        self.update_observation()
+        return self.observation.copy()
+
+    def deal(self, games):
+        # Shuffled decks dealt like CompactGame.deal, order[:, 0] on top
+        order = np.argsort(self.rng.random((len(games), CARD_COUNT)), axis=1).astype(np.uint8)
+        self.cards[games] = 0
+        self.sizes[games] = 0
+        self.count[games] = 0
+        dealt = 0
+        for pile in range(7):
+            self.cards[games, pile, :pile + 1] = order[:, dealt:dealt + pile + 1]
+            self.cards[games, pile, pile] |= FACE_UP
+            self.sizes[games, pile] = pile + 1
+            dealt += pile + 1
+        remaining = CARD_COUNT - dealt
+        self.cards[games, DECK, :remaining] = order[:, :dealt - 1:-1]
+        self.sizes[games, DECK] = remaining
+
+    def update_observation(self, games=slice(None)):
+        # Play piles: slot k shows the card k below the top while face up
+        sizes = self.sizes[games]
+        cards = self.cards[games]
+        depth = np.arange(13)
+        position = sizes[:, :7, np.newaxis] - 1 - depth
+        codes = np.take_along_axis(cards[:, :7], np.maximum(position, 0), axis=2)
+        shown = (position >= 0) & (codes & FACE_UP != 0)
+        self.slots[games, :91] = np.where(shown, (codes & CARD_MASK) + 1, 0).reshape(len(sizes), 91)
+        # Deck, discard and foundations show their top card
+        tops = np.take_along_axis(cards[:, DECK:], np.maximum(sizes[:, DECK:] - 1, 0)[..., np.newaxis], axis=2)[..., 0]
+        self.slots[games, 91:] = np.where(sizes[:, DECK:] > 0, (tops & CARD_MASK) + 1, 0)
+        self.observation[games] = np.moveaxis(OBSERVATION_TABLE[:, self.slots[games]], 0, 1)
+
+    def step(self, action):
+        games = self.games
+        current = np.asarray(action['current_location'])
+        next_loc = np.asarray(action['next_location'])
+
+        # translate_action / assign_action for the whole batch
+        source = self.location_pile[current]
+        target = self.location_pile[next_loc]
+        number = np.where(current < 91, current % 13 + 1, 1)
+        move = self.move_type[source, target]
+
+        valid = self.valid_actions(source, target, number, move)
+
+        rewards = np.where(valid, self.move_reward[source, target], -1).astype(np.float32)
+        redeal = valid & (move == DISCARD_DECK)
+        self.move_runs(games[valid & ~redeal], source[valid & ~redeal], target[valid & ~redeal], number[valid & ~redeal])
+        self.redeal_discard(games[redeal])
+
+        self.count += 1
+        won = ~self.sizes[:, :DISCARD + 1].any(axis=1)
+        rewards[won] += 1
+        dones = won.copy()
+        if self.max_steps is not None:
+            dones |= self.count >= self.max_steps
+
+        # Last observations of the finished games, before they are dealt again
+        self.update_observation()
+        final_observations = self.observation[dones]
+        if dones.any():
+            self.deal(games[dones])
+            self.update_observation(games[dones])
+
+        return self.observation.copy(), rewards, dones, {"valid": valid, "won": won,
+                                                          "final_observations": final_observations}
+
+    def valid_actions(self, source, target, number, move):
+        games = self.games
+        source_size = self.sizes[games, source]
+        target_size = self.sizes[games, target]
+
+        # Cannot do moves outside the reward table or move cards that don't exist
+        valid = (move >= 0) & (source_size > 0) & (number <= source_size)
+
+        bottom_card = self.cards[games, source, np.maximum(source_size - number, 0)]
+        top_card = self.cards[games, target, np.maximum(target_size - 1, 0)]
+        face_up = bottom_card & FACE_UP != 0
+        top_face_up = top_card & FACE_UP != 0
+        bottom_card = bottom_card & CARD_MASK
+        top_card = top_card & CARD_MASK
+
+        # Foundation moves: a single card, aces first, then same suit in order
+        foundation_rule = (number == 1) & np.where(
+            target_size == 0,
+            IS_ACE[bottom_card],
+            FOUNDATION_NEXT[bottom_card, top_card])
+
+        # Play pile moves: kings onto blank spaces, otherwise alternate
+        # colors in descending order onto a face up card
+        pile_rule = np.where(
+            target_size == 0,
+            IS_KING[bottom_card],
+            top_face_up & CAN_STACK[bottom_card, top_card])
+
+        rules = face_up & np.where(target > DISCARD, foundation_rule, pile_rule)
+        rules = np.where(move == DISCARD_DECK, self.sizes[:, DECK] == 0, rules)
+        rules = np.where(move == DECK_DISCARD, True, rules)
+        return valid & rules
+
+    def move_runs(self, games, source, target, number):
+        source_size = self.sizes[games, source]
+        target_size = self.sizes[games, target]
+        # Cards drawn from the deck are turned face up
+        flip = np.where(source == DECK, FACE_UP, 0).astype(np.uint8)
+        start = source_size - number
+        for card in range(int(number.max(initial=0))):
+            moving = card < number
+            self.cards[games[moving], target[moving], target_size[moving] + card] = \
+                self.cards[games[moving], source[moving], start[moving] + card] | flip[moving]
+        self.sizes[games, source] = start
+        self.sizes[games, target] = target_size + number
+        # Flip the card left on top of a play pile
+        uncovered = (source < 7) & (start > 0)
+        self.cards[games[uncovered], source[uncovered], start[uncovered] - 1] |= FACE_UP
+
+    def redeal_discard(self, games):
+        # Turn each discard pile over onto its empty deck
+        size = self.sizes[games, DISCARD][:, np.newaxis]
+        depth = np.arange(PILE_CAPACITY)
+        position = np.maximum(size - 1 - depth, 0)
+        discard = np.take_along_axis(self.cards[games, DISCARD], position, axis=1)
+        self.cards[games, DECK] = np.where(depth < size, discard & CARD_MASK, 0)
+        self.sizes[games, DECK] = size[:, 0]
+        self.sizes[games, DISCARD] = 0